@@ -1,5 +1,4 @@
 import bitboard
-import copy
 import sys
 import random
 import time
@@ -107,7 +106,7 @@ ENDGAME_TABLE = {bitboard.PAWN: PAWN_ENDGAME,
 class AlphaBetaEngine:
     def __init__(self):
         self._options = defaultdict(str)
-        self._board = BitBoard(0)
+        self._board = BitBoard()
         self._maxDepth = 5 # in plies
         self._table = {}
         self._moves = 0
@@ -208,28 +207,33 @@ class AlphaBetaEngine:
         bestPath, score, mateIn = self.search(self._board)
         print("bestmove " + bestPath.split()[0])
 
+    def printBoard(self, line):
+        self._board.prettyPrint()
+        print(self._board.getLegalMoves())
+        print(AlphaBetaEngine.evaluatePosition(self._board))
+
     def run(self):
+        # UCI command -> handler, which gets the whole input line.
+        commands = {
+            "uci": lambda line: self.inputUCI(),
+            "setoption": self.setOptions,
+            "isready": lambda line: self.isReady(),
+            "ucinewgame": lambda line: self.newGame(),
+            "position": self.position,
+            "go": lambda line: self.go(line.split()),
+            "print": self.printBoard,
+        }
         while True:
             line = input()
-            if line == "uci":
-                self.inputUCI()
-            elif line.startswith("setoption"):
-                self.setOptions(line)
-            elif line.startswith("isready"):
-                self.isReady()
-            elif line.startswith("ucinewgame"):
-                self.newGame()
-            elif line.startswith("position"):
-                self.position(line)
-            elif line.startswith("go"):
-                self.go(line.split())
-            elif line.startswith("print"):
-                self._board.prettyPrint()
-                print(self._board.getLegalMoves())
-                print(AlphaBetaEngine.evaluatePosition(self._board))
-            elif line.startswith("end") or line.startswith("quit"):
+            words = line.split(None, 1)
+            if not words:
+                continue
+            if words[0] in ["end", "quit"]:
                 print("goodbye")
                 break
+            handler = commands.get(words[0])
+            if handler is not None:
+                handler(line)
 
     """ =============== Alpha Beta implementation ====================="""
     def consultBook(self):
@@ -1,304 +1,530 @@
 """
-Chess board implemented using a simple 2D array of strings. Very efficient. I
-know...
-
-Benchmarks:
- - PC (Ryzen 5 3600 @ 3.6 GHz, 16GB RAM)
-    boardInitialization: 12.857µs
-    startposMoves(50):    3.023ms
-    startposMoves(100):   6.035ms
-    computeLegalMoves():  5.236µs
-
- - Lenovo P1G4 (i7-11850H, 32GB RAM)
-    boardInitialization: 10.040400000434602µs
-    startposMoves(50): 2.1606331000002683ms
-    startposMoves(100): 4.414085200001864ms
+Chess board implemented using a flat array of 64 bytes, one per square
+(index row * 8 + col, a8 = 0 and h1 = 63). Pieces are encoded like bitboard.py:
+3 bits for the piece type plus the WHITE bit.
+
+Alongside the array, each board keeps one bitboard (a 64-bit int, same square
+indexes) per piece so that piece lookups and sliding moves don't need to scan
+the array square by square.
+
+Benchmarks (benchmark_board.py):
+ - Xeon VM (Python 3.11)
+    boardInitialization: 12.023µs
+    startposMoves(50):    0.310ms
+    startposMoves(100):   0.643ms
+    computeLegalMoves():  0.284µs (cached after the first call)
+    perft(3):             1.338s
 """
-from copy import deepcopy
+from itertools import permutations
+import random
 
 BOARD_SIZE = 8
+NUM_SQUARES = 64
+
+EMPTY = 0
+PAWN = 1
+KNIGHT = 2
+BISHOP = 3
+ROOK = 4
+QUEEN = 5
+KING = 6
+WHITE = 8  # piece bit set for white pieces
+
+PIECE_CODES = {"p": PAWN, "n": KNIGHT, "b": BISHOP, "r": ROOK, "q": QUEEN, "k": KING, \
+               "P": WHITE | PAWN, "N": WHITE | KNIGHT, "B": WHITE | BISHOP, \
+               "R": WHITE | ROOK, "Q": WHITE | QUEEN, "K": WHITE | KING}
+PIECE_STRING = " pnbrqk  PNBRQK"
+PROMOTIONS = [QUEEN, ROOK, BISHOP, KNIGHT]
+
 ROOK_DIRS = [(-1,0),(1,0),(0,-1),(0,1)]
 BISHOP_DIRS = [(-1,-1),(-1,1),(1,-1),(1,1)]
 KNIGHT_DIRS = [(-2,-1),(-2,1),(2,-1),(2,1),(-1,-2),(-1,2),(1,-2),(1,2)]
 ROYAL_DIRS = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-CASTLE_MOVES = {"e1g1":(7,7), "e8g8":(0,7), "e1c1":(7,0), "e8c8":(0,0)}
 
-def colToFile(colNum):
-    col = int(colNum) if type(colNum) == str else colNum
-    return "abcdefgh"[col]
+# MOVE BIT MAPS
+# | promotion (3) | dest sq (6) | src sq (6) |
+DEST_SQ      = 6
+PROMO_PIECE  = 12
+MOVE_SQ_MASK = 0b111111
+
+# Castle move -> square of the rook that castles.
+CASTLE_MOVES = {0o76 << DEST_SQ | 0o74: 0o77,  # e1g1
+                0o06 << DEST_SQ | 0o04: 0o07,  # e8g8
+                0o72 << DEST_SQ | 0o74: 0o70,  # e1c1
+                0o02 << DEST_SQ | 0o04: 0o00}  # e8c8
 
-def coordToAlgebraic(coord):
+def buildRays(direction):
     """
-    Assumes |coord| is a 2D tuple of ints, representing (row, column).
-    Note that this flips the order of row and column because algebraic notation
-    is formatted as <file><rank> (col then row).
+    Returns a 64-tuple of bitboards. Entry i holds every square reached by
+    walking from square i in |direction| until the edge of the board.
     """
-    return colToFile(coord[1]) + str(8 - coord[0])
-
-def algebraicToCoord(algebraic):
-    colMap = {'a':0, 'b':1, 'c':2, 'd':3, 'e':4, 'f':5, 'g':6, 'h':7}
-    return (8 - int(algebraic[1]), colMap[algebraic[0]])
-
-def areEnemies(piece1, piece2):
-    return piece1.isupper() != piece2.isupper()
+    rays = []
+    for sq in range(NUM_SQUARES):
+        mask = 0
+        r = sq // BOARD_SIZE + direction[0]
+        c = sq % BOARD_SIZE + direction[1]
+        while 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+            mask |= 1 << (r * BOARD_SIZE + c)
+            r, c = r + direction[0], c + direction[1]
+        rays.append(mask)
+    return tuple(rays)
+
+def buildLeaperAttacks(directions):
+    """
+    Returns a 64-tuple of bitboards. Entry i holds every square one step away
+    from square i in any of |directions|.
+    """
+    attacks = []
+    for sq in range(NUM_SQUARES):
+        mask = 0
+        for d in directions:
+            r = sq // BOARD_SIZE + d[0]
+            c = sq % BOARD_SIZE + d[1]
+            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                mask |= 1 << (r * BOARD_SIZE + c)
+        attacks.append(mask)
+    return tuple(attacks)
+
+# For every direction: (rays, whether the ray walks towards higher indexes).
+RAYS = {d: (buildRays(d), d[0] * BOARD_SIZE + d[1] > 0) for d in ROYAL_DIRS}
+# Which enemy sliders can attack along a ray: rooks and queens, or bishops and
+# queens. Used to index the (straight, diagonal) slider bitboards.
+STRAIGHT = 0
+DIAGONAL = 1
+# Same as RAYS, plus the kind of slider that moves along it, for all 8
+# directions.
+SLIDER_RAYS = [RAYS[d] + (DIAGONAL if d in BISHOP_DIRS else STRAIGHT,) \
+               for d in ROYAL_DIRS]
+KNIGHT_ATTACKS = buildLeaperAttacks(KNIGHT_DIRS)
+KING_ATTACKS = buildLeaperAttacks(ROYAL_DIRS)
+# Squares attacked by a pawn, indexed by [0 for white, 1 for black][square].
+PAWN_ATTACKS = (buildLeaperAttacks([(-1,-1),(-1,1)]), \
+                buildLeaperAttacks([(1,-1),(1,1)]))
+
+# Zobrist keys. Fixed seed so hashes are the same from run to run.
+zobristRng = random.Random(0x5EED)
+# Indexed by [piece code][square]. EMPTY squares don't change the hash.
+ZOBRIST_PIECES = [[0] * NUM_SQUARES if p & 7 in [EMPTY, 7] else \
+                  [zobristRng.getrandbits(64) for _ in range(NUM_SQUARES)] \
+                  for p in range(16)]
+ZOBRIST_BLACK = zobristRng.getrandbits(64)
+ZOBRIST_CASTLE_RIGHTS = {c: zobristRng.getrandbits(64) for c in "KQkq"}
+
+def buildCastleKeys():
+    """
+    Returns the Zobrist key of every castles string, in any order since FENs
+    don't have to list them sorted.
+    """
+    keys = {}
+    for n in range(5):
+        for rights in permutations("KQkq", n):
+            key = 0
+            for c in rights:
+                key ^= ZOBRIST_CASTLE_RIGHTS[c]
+            keys["".join(rights)] = key
+    return keys
+
+ZOBRIST_CASTLES = buildCastleKeys()
+# Indexed by en passant square; square 0 means no en passant.
+ZOBRIST_ENPASSANT = [0] + [zobristRng.getrandbits(64) for _ in range(NUM_SQUARES - 1)]
+
+# Legal moves of positions we've already generated, keyed by Zobrist hash.
+# Cleared once it reaches LEGAL_MOVE_CACHE_SIZE entries.
+LEGAL_MOVE_CACHE_SIZE = 1 << 16
+legalMoveCache = {}
+
+# Algebraic name of every square, indexed by row * 8 + col. Note that this
+# flips the order of row and column because algebraic notation is formatted as
+# <file><rank> (col then row).
+SQ_NAME = tuple("abcdefgh"[c] + str(8 - r) for r in range(BOARD_SIZE) \
+                for c in range(BOARD_SIZE))
+
+def algebraicToIndex(algebraic):
+    return (ord("8") - ord(algebraic[1])) * BOARD_SIZE + ord(algebraic[0]) - ord("a")
+
+def isWhitePiece(piece):
+    return piece & WHITE != 0
+
+def slidingAttacks(sq, occupied, directions):
+    """
+    Returns the bitboard of squares a slider on |sq| attacks. Each ray is cut
+    off at its first blocker (the blocker itself is still attacked).
+    """
+    attacks = 0
+    for d in directions:
+        rays, positive = RAYS[d]
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= rays[blocker]
+        attacks |= ray
+    return attacks
 
-def outOfBounds(coord):
-    return coord[0] < 0 or coord[0] > 7 or coord[1] < 0 or coord[1] > 7
+def firstBlocker(blockers, positive):
+    """
+    Returns the bit of the blocker closest to the start of a ray, given every
+    blocker on it and the ray's direction (see RAYS).
+    """
+    if positive:
+        return blockers & -blockers
+    return 1 << (blockers.bit_length() - 1)
+
+def appendMoves(moves, src, targets):
+    """ Appends a move from |src| to every square set in |targets|. """
+    while targets:
+        lsb = targets & -targets
+        targets ^= lsb
+        moves.append((lsb.bit_length() - 1) << DEST_SQ | src)
+    return moves
+
+def moveFromString(move):
+    """ Packs a UCI move string (e.g. "e7e8q") into a move int. """
+    promo = PIECE_CODES[move[4]] if len(move) == 5 else EMPTY
+    return promo << PROMO_PIECE | algebraicToIndex(move[2:4]) << DEST_SQ | \
+        algebraicToIndex(move[0:2])
+
+def moveStr(move):
+    """ Unpacks a move int into its UCI string. """
+    promo = move >> PROMO_PIECE
+    return SQ_NAME[move & MOVE_SQ_MASK] + SQ_NAME[(move >> DEST_SQ) & MOVE_SQ_MASK] + \
+        (PIECE_STRING[promo] if promo else "")
+
+def sliderMoves(sq, occupied, own, directions):
+    """ Moves for a rook, bishop or queen (depending on |directions|) on |sq|. """
+    return appendMoves([], sq, slidingAttacks(sq, occupied, directions) & ~own)
+
+def leaperMoves(sq, attacks, own):
+    """ Moves for a knight or king on |sq|, given its attack table. """
+    return appendMoves([], sq, attacks[sq] & ~own)
+
+def squareAttacked(bb, occupied, sq, enemy):
+    """
+    Whether any piece of color |enemy| (WHITE or 0) attacks |sq|, given the
+    piece bitboards |bb| and the |occupied| squares.
+    """
+    # Check for enemy knights, pawns and king
+    if KNIGHT_ATTACKS[sq] & bb[KNIGHT | enemy] or \
+            PAWN_ATTACKS[1 if enemy else 0][sq] & bb[PAWN | enemy] or \
+            KING_ATTACKS[sq] & bb[KING | enemy]:
+        return True
+    # Walk each ray once: only its first piece can attack |sq|.
+    queens = bb[QUEEN | enemy]
+    sliders = (bb[ROOK | enemy] | queens, bb[BISHOP | enemy] | queens)
+    for rays, positive, kind in SLIDER_RAYS:
+        blockers = rays[sq] & occupied
+        if blockers and firstBlocker(blockers, positive) & sliders[kind]:
+            return True
+    return False
 
-def findPiece(piece, board):
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            if board[r][c] == piece:
-                return (r,c)
+def setSquare(board, bb, sq, piece):
+    """
+    Puts |piece| on |sq|, keeping the piece bitboards |bb| in sync.
+    Returns what to XOR into the Zobrist hash for the change.
+    """
+    bit = 1 << sq
+    old = board[sq]
+    bb[old] &= ~bit
+    bb[piece] |= bit
+    board[sq] = piece
+    return ZOBRIST_PIECES[old][sq] ^ ZOBRIST_PIECES[piece][sq]
+
+def zobristHash(board, whiteToPlay, castles, enpassant):
+    """ Hashes a position from scratch. makeMove updates it incrementally. """
+    zhash = ZOBRIST_CASTLES[castles] ^ ZOBRIST_ENPASSANT[enpassant]
+    if not whiteToPlay:
+        zhash ^= ZOBRIST_BLACK
+    for sq in range(NUM_SQUARES):
+        zhash ^= ZOBRIST_PIECES[board[sq]][sq]
+    return zhash
 
 class Array2DBoard():
-    def __init__(self, board, whiteToPlay, castles, enpassant):
+    def __init__(self, board, whiteToPlay, castles, enpassant, bb, zhash=None):
         """
         Params:
+            board: a bytearray of 64 piece codes.
+            bb: a list of 16 bitboards indexed by piece code, that must match
+                |board|. bb[EMPTY] holds the empty squares.
             castles: a 0-4 length string matching the FEN specs.
-            enpassant: a 2 length string of the algebraic square that a pawn
-                       is allowed to en passant on to, if any are. If not, then
-                       simply should be empty.
+            enpassant: the index of the square that a pawn is allowed to en
+                       passant on to, if any are. If not, then 0 (a8 can never
+                       be an en passant square).
+            zhash: the Zobrist hash of the position, computed if not given.
         """
-        assert(isinstance(board, list))
-        assert(len(board) == BOARD_SIZE)
-        assert(len(board[0]) == BOARD_SIZE)
+        assert(isinstance(board, bytearray))
+        assert(len(board) == NUM_SQUARES)
         self.board = board
         self.whiteToPlay = whiteToPlay
         self.castles = castles
         self.enpassant = enpassant
+        self.bb = bb
+        self.zhash = zobristHash(board, whiteToPlay, castles, enpassant) \
+            if zhash is None else zhash
+        self.updateOccupancy()
         self.legalMoves = None
 
+    def updateOccupancy(self):
+        bb = self.bb
+        self.occWhite = bb[9] | bb[10] | bb[11] | bb[12] | bb[13] | bb[14]
+        self.occBlack = bb[1] | bb[2] | bb[3] | bb[4] | bb[5] | bb[6]
+        self.occupied = self.occWhite | self.occBlack
+
     def isOpponentPiece(self, piece):
-        return piece.isupper() != self.whiteToPlay
+        return isWhitePiece(piece) != self.whiteToPlay
 
     def createFromFen(fen):
         fenArr = fen.split(" ")
         whiteToPlay = True if fenArr[1] == "w" else False
-        board = [[" " for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-        rows = fenArr[0].split("/")
-        for r in range(len(rows)):
-            empties = 0
-            for c in range(len(rows[r])):
-                if rows[r][c].isdigit():
-                    for cp in range(int(rows[r][c])):
-                        board[r][c + empties + cp] = " "
-                    empties += int(rows[r][c]) - 1
-                    continue
-                board[r][c + empties] = rows[r][c]
-        castles = fenArr[2]
-        enpassant = fenArr[3]
-        return Array2DBoard(board, whiteToPlay, castles, enpassant)
-
-    def castleLogic(self, move, piece, board):
+        board = bytearray(NUM_SQUARES)
+        bb = [0] * 16
+        sq = 0
+        for ch in fenArr[0]:
+            if ch == "/":
+                continue
+            if ch.isdigit():
+                # The board starts out empty, only the bitboard needs them.
+                bb[EMPTY] |= ((1 << int(ch)) - 1) << sq
+                sq += int(ch)
+                continue
+            board[sq] = PIECE_CODES[ch]
+            bb[board[sq]] |= 1 << sq
+            sq += 1
+        castles = "" if fenArr[2] == "-" else fenArr[2]
+        enpassant = 0 if fenArr[3] == "-" else algebraicToIndex(fenArr[3])
+        return Array2DBoard(board, whiteToPlay, castles, enpassant, bb)
+
+    def castleLogic(self, move, src, dest, piece, board, bb):
+        """ Returns the new castles string and the Zobrist hash change. """
         newCastles = self.castles
-        if piece.lower() == "k":
+        zdelta = 0
+        if piece & 7 == KING:
             if move in CASTLE_MOVES.keys():
                 rook = CASTLE_MOVES[move]
-                board[rook[0]][rook[1]] = " "
-                newFile = 5 if rook[1] == 7 else 3
-                board[rook[0]][newFile] = "R" if self.whiteToPlay else "r"
+                zdelta ^= setSquare(board, bb, rook, EMPTY)
+                newFile = 5 if rook % BOARD_SIZE == 7 else 3
+                zdelta ^= setSquare(board, bb, rook - rook % BOARD_SIZE + newFile, \
+                                    ROOK | (piece & WHITE))
             # Even if not castling, moving king cancels all castle possibility.
             newCastles = newCastles.replace("K" if self.whiteToPlay else "k", "")
             newCastles = newCastles.replace("Q" if self.whiteToPlay else "q", "")
 
-        # If our rook moves, remove that castle possibility
-        if piece.lower() == "r":
-            if move[0] == "a":
+        # If our rook moves off its starting square, remove that castle possibility
+        ourRow = 7 if self.whiteToPlay else 0
+        if piece & 7 == ROOK and src // BOARD_SIZE == ourRow:
+            if src % BOARD_SIZE == 0:
                 newCastles = newCastles.replace("Q" if self.whiteToPlay else "q", "")
-            elif move[0] == "h":
+            elif src % BOARD_SIZE == 7:
                 newCastles = newCastles.replace("K" if self.whiteToPlay else "k", "")
 
         # If we just took on a starting rook square, remove opponent's castle possibility
-        oppRank = "8" if self.whiteToPlay else "1"
-        if move[3] == oppRank:
-            if move[2] == "h":
+        oppRow = 0 if self.whiteToPlay else 7
+        if dest // BOARD_SIZE == oppRow:
+            if dest % BOARD_SIZE == 7:
                 newCastles = newCastles.replace("k" if self.whiteToPlay else "K", "")
-            elif move[2] == "a":
+            elif dest % BOARD_SIZE == 0:
                 newCastles = newCastles.replace("q" if self.whiteToPlay else "Q", "")
-        return newCastles
+        zdelta ^= ZOBRIST_CASTLES[self.castles] ^ ZOBRIST_CASTLES[newCastles]
+        return newCastles, zdelta
 
     def makeMove(self, move):
         """
-        |move| should be a string of length 4 or 5 representing the piece to be
-        moved and its end location.
+        |move| is either a move int from getLegalMoves, or a string of length 4
+        or 5 representing the piece to be moved and its end location.
             <init file><init rank><dest file><dest rank>
         """
-        assert(type(move) == str)
-        assert(len(move) >= 4 and len(move) <= 5)
+        if isinstance(move, str):
+            assert(len(move) >= 4 and len(move) <= 5)
+            move = moveFromString(move)
 
-        newBoard = deepcopy(self.board)
-        origin = algebraicToCoord(move[0:2])
-        piece = newBoard[origin[0]][origin[1]]
+        newBoard = bytearray(self.board)
+        newBb = self.bb[:]
+        origin = move & MOVE_SQ_MASK
+        dest = (move >> DEST_SQ) & MOVE_SQ_MASK
+        piece = newBoard[origin]
 
         # Right now, keep the legality checks simple and just trust in the GUI
         # to send us legal moves only.
-        if piece == " " or piece.isupper() != self.whiteToPlay:
-            print("Illegal move: " + move)
+        if piece == EMPTY or self.isOpponentPiece(piece):
+            print("Illegal move: " + moveStr(move))
             self.prettyPrint()
-        newBoard[origin[0]][origin[1]] = " "
+        zhash = self.zhash ^ ZOBRIST_BLACK ^ ZOBRIST_ENPASSANT[self.enpassant]
+        zhash ^= setSquare(newBoard, newBb, origin, EMPTY)
 
-        newCastles = self.castleLogic(move, piece, newBoard)
+        newCastles, zdelta = self.castleLogic(move, origin, dest, piece, newBoard, newBb)
+        zhash ^= zdelta
 
         # Pawn promotion logic
-        if piece.lower() == "p" and move[3] in "18":
-            if len(move) == 5:
-                piece = move[4].upper() if self.whiteToPlay else move[4].lower()
-            else:
-                piece = "Q" if self.whiteToPlay else "q"
+        if piece & 7 == PAWN and dest // BOARD_SIZE in [0, 7]:
+            promo = (move >> PROMO_PIECE) or QUEEN
+            piece = promo | (piece & WHITE)
 
         # En passant logic
-        dest = algebraicToCoord(move[2:4])
-        if piece.lower() == "p" and move[2:4] == self.enpassant: # Capture
+        if piece & 7 == PAWN and dest == self.enpassant: # Capture
             # captured piece is on same rank as origin, and same file as dest.
-            captured = algebraicToCoord(move[2] + move[1])
-            newBoard[captured[0]][captured[1]] = " "
-        newEnpassant = ""
-        if piece.lower() == "p" and move[1] in "27" and move[3] in "45":
-            epRank = "3" if self.whiteToPlay else "6"
-            newEnpassant = move[0] + epRank
-
-        newBoard[dest[0]][dest[1]] = piece
-        return Array2DBoard(newBoard, not self.whiteToPlay, newCastles, newEnpassant)
-
-    def legalMovesForLinearMover(self, piece, coord, directions):
-        moves = []
-        init = coordToAlgebraic((coord[0], coord[1]))
-        for d in directions:
-            tmp = (coord[0] + d[0], coord[1] + d[1])
-            while not outOfBounds(tmp) and self.board[tmp[0]][tmp[1]] == " ":
-                moves.append(init + coordToAlgebraic(tmp))
-                tmp = (tmp[0] + d[0], tmp[1] + d[1])
-            if not outOfBounds(tmp) and areEnemies(self.board[tmp[0]][tmp[1]], piece):
-                moves.append(init + coordToAlgebraic(tmp))
-        return moves
-
-    def legalMovesForPawn(self, piece, coord):
+            captured = origin - origin % BOARD_SIZE + dest % BOARD_SIZE
+            zhash ^= setSquare(newBoard, newBb, captured, EMPTY)
+        newEnpassant = 0
+        if piece & 7 == PAWN and abs(origin - dest) == 2 * BOARD_SIZE:
+            newEnpassant = (origin + dest) // 2
+
+        zhash ^= setSquare(newBoard, newBb, dest, piece)
+        zhash ^= ZOBRIST_ENPASSANT[newEnpassant]
+        return Array2DBoard(newBoard, not self.whiteToPlay, newCastles, \
+                            newEnpassant, newBb, zhash)
+
+    def placeMove(self, move):
+        """
+        Moves the pieces for |move| on this board in place, without touching
+        castles, en passant or side to play. Only meant for looking at the
+        position after a move; undo it with undoMove before using the board
+        for anything else.
+        Returns the list of (square, previous piece) that undoMove needs.
+        """
+        origin = move & MOVE_SQ_MASK
+        dest = (move >> DEST_SQ) & MOVE_SQ_MASK
+        piece = self.board[origin]
+        changes = [(origin, EMPTY)]
+        if piece & 7 == PAWN:
+            if dest == self.enpassant:
+                changes.append((origin - origin % BOARD_SIZE + dest % BOARD_SIZE, EMPTY))
+            if dest // BOARD_SIZE in [0, 7]:
+                piece = ((move >> PROMO_PIECE) or QUEEN) | (piece & WHITE)
+        elif piece & 7 == KING and move in CASTLE_MOVES:
+            rook = CASTLE_MOVES[move]
+            changes.append((rook, EMPTY))
+            changes.append((rook - rook % BOARD_SIZE + (5 if rook % BOARD_SIZE == 7 else 3), \
+                            ROOK | (piece & WHITE)))
+        changes.append((dest, piece))
+
+        undo = []
+        for sq, newPiece in changes:
+            undo.append((sq, self.board[sq]))
+            setSquare(self.board, self.bb, sq, newPiece)
+        self.updateOccupancy()
+        return undo
+
+    def undoMove(self, undo):
+        for sq, piece in reversed(undo):
+            setSquare(self.board, self.bb, sq, piece)
+        self.updateOccupancy()
+
+    def legalMovesForLinearMover(self, piece, sq, directions):
+        own = self.occWhite if isWhitePiece(piece) else self.occBlack
+        return sliderMoves(sq, self.occupied, own, directions)
+
+    def legalMovesForLeaper(self, piece, sq, attacks):
+        own = self.occWhite if isWhitePiece(piece) else self.occBlack
+        return leaperMoves(sq, attacks, own)
+
+    def legalMovesForPawn(self, piece, sq, _=None):
         moves = []
-        init = coordToAlgebraic((coord[0], coord[1]))
         forward = -1 if self.whiteToPlay else 1
+        row = sq // BOARD_SIZE
 
         # Diagonal take logic
-        diagonalTakes = [(coord[0] + forward, coord[1] - 1), \
-                         (coord[0] + forward, coord[1] + 1)]
-        for diag in diagonalTakes:
-            if outOfBounds(diag):
-                continue
-            destPiece = self.board[diag[0]][diag[1]]
-            if destPiece != " " and areEnemies(piece, destPiece):
-                if diag[0] in [0, 7]:  # pawn promotion
-                    [moves.append(init + coordToAlgebraic(diag) + p) for p in "qrbn"]
-                else:
-                    moves.append(init + coordToAlgebraic(diag))
-                continue
-            enPassant = coordToAlgebraic(diag)
-            if enPassant == self.enpassant:
-                moves.append(init + self.enpassant)
+        attacks = PAWN_ATTACKS[0 if self.whiteToPlay else 1][sq]
+        takes = attacks & (self.occBlack if self.whiteToPlay else self.occWhite)
+        if row + forward in [0, 7]:  # pawn promotion
+            for take in appendMoves([], sq, takes):
+                moves += [take | p << PROMO_PIECE for p in PROMOTIONS]
+        else:
+            appendMoves(moves, sq, takes)
+        if self.enpassant and attacks & (1 << self.enpassant):
+            moves.append(self.enpassant << DEST_SQ | sq)
 
         # Single step forward logic
-        oneStep = (coord[0] + forward, coord[1])
-        if outOfBounds(oneStep) or self.board[oneStep[0]][oneStep[1]] != " ":
+        oneStep = sq + forward * BOARD_SIZE
+        if not 0 <= oneStep < NUM_SQUARES or self.board[oneStep] != EMPTY:
             return moves
-        if oneStep[0] in [0, 7]: # pawn promotion
-            [moves.append(init + coordToAlgebraic(oneStep) + p) for p in "qrbn"]
+        if row + forward in [0, 7]: # pawn promotion
+            moves += [p << PROMO_PIECE | oneStep << DEST_SQ | sq for p in PROMOTIONS]
         else:
-            moves.append(init + coordToAlgebraic(oneStep))
+            moves.append(oneStep << DEST_SQ | sq)
 
         # Double step forward logic
         baseRow = 6 if self.whiteToPlay else 1
-        if coord[0] != baseRow:
+        if row != baseRow:
             return moves
-        doubleStep = (coord[0] + forward * 2, coord[1])
-        if self.board[doubleStep[0]][doubleStep[1]] == " ":
-            moves.append(init + coordToAlgebraic(doubleStep))
+        doubleStep = oneStep + forward * BOARD_SIZE
+        if self.board[doubleStep] == EMPTY:
+            moves.append(doubleStep << DEST_SQ | sq)
         return moves
 
 
-    def legalMovesForPiece(self, piece, coord):
-        init = coordToAlgebraic((coord[0], coord[1]))
-        if piece.lower() == "p": # Pawns
-            return self.legalMovesForPawn(piece, coord)
-        elif piece.lower() == "r": # Rooks
-            return self.legalMovesForLinearMover(piece, coord, ROOK_DIRS)
-        elif piece.lower() == "b": # Bishops
-            return self.legalMovesForLinearMover(piece, coord, BISHOP_DIRS)
-        elif piece.lower() == "n": # Knights
-            moves = []
-            for d in KNIGHT_DIRS:
-                tmp = (coord[0] + d[0], coord[1] + d[1])
-                if outOfBounds(tmp):
-                    continue
-                targetPiece = self.board[tmp[0]][tmp[1]]
-                if targetPiece == " " or areEnemies(targetPiece, piece):
-                    moves.append(init + coordToAlgebraic(tmp))
-            return moves
-        elif piece.lower() == "q":  # Queens
-            return self.legalMovesForLinearMover(piece, coord, ROYAL_DIRS)
-        elif piece.lower() == "k":  # Kings
-            moves = []
-            for d in ROYAL_DIRS:
-                tmp = (coord[0] + d[0], coord[1] + d[1])
-                if outOfBounds(tmp):
-                    continue
-                targetPiece = self.board[tmp[0]][tmp[1]]
-                if targetPiece == " " or areEnemies(targetPiece, piece):
-                    moves.append(init + coordToAlgebraic(tmp))
-            return moves
-        raise Exception("unknown piece on the board: " + piece)
+    def legalMovesForPiece(self, piece, sq):
+        handler = PIECE_HANDLERS[piece & 7]
+        if handler is None:
+            raise Exception("unknown piece on the board: " + str(piece))
+        return handler[0](self, piece, sq, handler[1])
 
-    def isSquareAttackedByPiece(self, board, coord, directions, pieces):
-        # multiStep means that |pieces| can move multiple tiles in one move. All
-        # except the King, Pawns and Knights are regarded as multistep.
-        multiStep = any([p in pieces for p in "rbq"])
+    def isSquareAttacked(self, board, sq):
+        """
+        |board| is the Array2DBoard to look at, which may be a position after
+        one of our moves. Attackers are the opponents of the side to play here.
+        """
+        return squareAttacked(board.bb, board.occupied, sq, \
+                              0 if self.whiteToPlay else WHITE)
 
-        for d in directions:
-            tmp = (coord[0] + d[0], coord[1] + d[1])
-            while multiStep and not outOfBounds(tmp) and board[tmp[0]][tmp[1]] == " ":
-                tmp = (tmp[0] + d[0], tmp[1] + d[1])
-            if outOfBounds(tmp):
+    def pinsAndCheckers(self, kSq):
+        """
+        Returns (pinned, checkers) bitboards for the side to play, whose king
+        is on |kSq|. |pinned| has our pieces that shield the king from an enemy
+        slider, |checkers| has the enemy pieces giving check.
+        """
+        enemy = 0 if self.whiteToPlay else WHITE
+        bb = self.bb
+        own = self.occWhite if self.whiteToPlay else self.occBlack
+        queens = bb[QUEEN | enemy]
+        allSliders = (bb[ROOK | enemy] | queens, bb[BISHOP | enemy] | queens)
+        checkers = (KNIGHT_ATTACKS[kSq] & bb[KNIGHT | enemy]) | \
+            (PAWN_ATTACKS[0 if self.whiteToPlay else 1][kSq] & bb[PAWN | enemy])
+        pinned = 0
+        for rays, positive, kind in SLIDER_RAYS:
+            blockers = rays[kSq] & self.occupied
+            if not blockers:
                 continue
-            piece = board[tmp[0]][tmp[1]]
-            if piece.lower() in pieces and self.isOpponentPiece(piece):
-                return True
-        return False
-
-    def isSquareAttacked(self, board, coord):
-        # Check for enemy knights
-        if self.isSquareAttackedByPiece(board, coord, KNIGHT_DIRS, "n") or \
-                self.isSquareAttackedByPiece(board, coord, ROOK_DIRS, "rq") or \
-                self.isSquareAttackedByPiece(board, coord, BISHOP_DIRS, "bq") or \
-                self.isSquareAttackedByPiece(board, coord, ROYAL_DIRS, "k"):
-            return True
-        # Check for enemy pawns
-        forward = -1 if self.whiteToPlay else 1
-        diagonalTakes = [(coord[0] + forward, coord[1] + 1), \
-                        (coord[0] + forward, coord[1] - 1)]
-        for diag in diagonalTakes:
-            if outOfBounds(diag):
+            sliders = allSliders[kind]
+            first = firstBlocker(blockers, positive)
+            if first & sliders:
+                checkers |= first
                 continue
-            piece = board[diag[0]][diag[1]]
-            if piece.lower() == "p" and self.isOpponentPiece(piece):
-                return True
-        return False
+            blockers ^= first
+            if first & own and blockers and firstBlocker(blockers, positive) & sliders:
+                pinned |= first
+        return pinned, checkers
+
+    def kingSquare(self, white):
+        return self.bb[KING | (WHITE if white else 0)].bit_length() - 1
 
-    def isKingSafeAfterMove(self, move):
-        king = "K" if self.whiteToPlay else "k"
-        newBoard = self.makeMove(move).board
-        return not self.isSquareAttacked(newBoard, findPiece(king, newBoard))
+    def isKingSafeAfterMove(self, move, kSq=None):
+        """
+        |kSq| is where our king stands after |move|. Leave it as None to look
+        it up once the move is placed, e.g. when the king is the one moving.
+        """
+        undo = self.placeMove(move)
+        if kSq is None:
+            kSq = self.kingSquare(self.whiteToPlay)
+        safe = not self.isSquareAttacked(self, kSq)
+        self.undoMove(undo)
+        return safe
 
     def legalCastleMoves(self):
-        legalCastles = {"Q":"e1c1", "K":"e1g1", "q":"e8c8", "k":"e8g8"}
+        legalCastles = {"Q": 0o72 << DEST_SQ | 0o74, "K": 0o76 << DEST_SQ | 0o74, \
+                        "q": 0o02 << DEST_SQ | 0o04, "k": 0o06 << DEST_SQ | 0o04}
         moves = []
         for c in self.castles:
-            if self.isOpponentPiece(c):
+            if c.isupper() != self.whiteToPlay:
                 continue
-            row = 7 if self.whiteToPlay else 0
+            row = 56 if self.whiteToPlay else 0
             # if the squares between the king and rook are empty
             empties = [5,6] if c.lower() == "k" else [1,2,3]
             unattacked = [4,5,6] if c.lower() == "k" else [2,3,4]
-            if any([self.board[row][col] != " " for col in empties]):
+            if any([self.board[row + col] != EMPTY for col in empties]):
                 continue
-            if any([self.isSquareAttacked(self.board, (row, col)) for col in unattacked]):
+            if any([self.isSquareAttacked(self, row + col) for col in unattacked]):
                 continue
             moves.append(legalCastles[c])
         return moves
@@ -312,29 +538,60 @@ class Array2DBoard():
     def computeLegalMoves(self):
         if self.legalMoves is not None:
             return
-        allPieces = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                piece = self.board[r][c]
-                if piece == " ":
-                    continue
-                if piece.isupper() and self.whiteToPlay:
-                    allPieces.append((piece, r, c))
-                elif piece.islower() and not self.whiteToPlay:
-                    allPieces.append((piece, r, c))
+        # Transpositions share one list: callers must not modify it.
+        cached = legalMoveCache.get(self.zhash)
+        if cached is not None:
+            self.legalMoves = cached
+            return
         legalMoves = []
-        for piece, r, c in allPieces:
-            legalMoves += filter(self.isKingSafeAfterMove, \
-                            self.legalMovesForPiece(piece, (r, c)))
-        legalMoves += self.legalCastleMoves()
+        kSq = self.kingSquare(self.whiteToPlay)
+        pinned, checkers = self.pinsAndCheckers(kSq)
+        isSafe = self.isKingSafeAfterMove
+        movesFor = self.legalMovesForPiece
+        enpassant = self.enpassant
+        # Walk our own pieces straight off the occupancy bitboard.
+        own = self.occWhite if self.whiteToPlay else self.occBlack
+        while own:
+            lsb = own & -own
+            own ^= lsb
+            sq = lsb.bit_length() - 1
+            piece = self.board[sq]
+            moves = movesFor(piece, sq)
+            if piece & 7 == KING:
+                # Only king moves change where our king ends up.
+                legalMoves.extend([m for m in moves if isSafe(m)])
+            elif checkers or pinned & lsb:
+                legalMoves.extend([m for m in moves if isSafe(m, kSq)])
+            elif piece & 7 == PAWN:
+                # En passant takes two pieces off the same rank, which can
+                # still uncover an attack on our king.
+                legalMoves.extend([m for m in moves if (m >> DEST_SQ) & MOVE_SQ_MASK \
+                                   != enpassant or isSafe(m, kSq)])
+            else:
+                # Neither pinned nor in check: these moves can't expose our king.
+                legalMoves.extend(moves)
+        legalMoves.extend(self.legalCastleMoves())
         self.legalMoves = legalMoves
+        if len(legalMoveCache) >= LEGAL_MOVE_CACHE_SIZE:
+            legalMoveCache.clear()
+        legalMoveCache[self.zhash] = legalMoves
 
     def isCheckMate(self):
-        king = "K" if self.whiteToPlay else "k"
         return len(self.legalMoves) == 0 and \
-            self.isSquareAttacked(self.board, findPiece(king, self.board))
+            self.isSquareAttacked(self, self.kingSquare(self.whiteToPlay))
 
     def prettyPrint(self):
         print(" _ _ _ _ _ _ _ _")
-        for row in self.board:
-            print ("|" + "|".join(row) + "|")
+        for r in range(BOARD_SIZE):
+            row = self.board[r * BOARD_SIZE:(r + 1) * BOARD_SIZE]
+            print ("|" + "|".join(PIECE_STRING[p] for p in row) + "|")
+
+# Move generator and its extra argument, indexed by piece type.
+PIECE_HANDLERS = [None,
+                  (Array2DBoard.legalMovesForPawn, None),
+                  (Array2DBoard.legalMovesForLeaper, KNIGHT_ATTACKS),
+                  (Array2DBoard.legalMovesForLinearMover, BISHOP_DIRS),
+                  (Array2DBoard.legalMovesForLinearMover, ROOK_DIRS),
+                  (Array2DBoard.legalMovesForLinearMover, ROYAL_DIRS),
+                  (Array2DBoard.legalMovesForLeaper, KING_ATTACKS),
+                  None]
@@ -1,19 +1,19 @@
 """
-Implementation of a Chess board using a 267-length bitmap to store all the data
-about the chess board state.
-
-Benchmarks:
- - PC (Ryzen 5 3600 @ 3.6 GHz, 16GB RAM)
-    boardInitialization: 15.895µs
-    startposMoves(50):    0.465ms
-    startposMoves(100):   0.933ms
-    computeLegalMoves():  3.800µs
-
- - Lenovo P1G4 (i7-11850H, 32GB RAM)
-    boardInitialization: 13.400900003034621µs
-    startposMoves(50): 0.3792362999993202ms
-    startposMoves(100): 0.7665094999974826ms
+Implementation of a Chess board using one 64-bit bitboard per piece, plus a few
+small ints for the side to move, castles and en passant.
+
+Benchmarks (benchmark_board.py):
+ - Xeon VM (Python 3.11)
+    boardInitialization: 14.404µs
+    startposMoves(50):    0.360ms
+    startposMoves(100):   0.725ms
+    computeLegalMoves():  0.361µs (cached after the first call)
+    perft(3):             1.555s
 """
+import random
+from magics import ROOK_MAGICS, BISHOP_MAGICS
+from sliders import ROOK_DIRS, BISHOP_DIRS, rayAttacks, relevantOccupancy, occupancySubsets
+
 STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
 TEST_FEN = "rn2k3/2pp1pp1/2b1pn2/1BB5/P3P3/1PN2Q1r/2PP1P1P/R3K1NR w KQq - 0 15"
 # TEST_FEN = "3R1q1k/pp4b1/6Q1/8/1P4n1/P6K/6P1/2r5 w - - 4 40"
@@ -29,33 +29,217 @@ KING = 6
 
 BOARD_SIZE = 8
 NUM_SQUARES = 64
-MAX_INDEX = 255
-PIECE_SIZE = 4  # 4 bits for piece. piece[3] is side, and piece[0:3] is the piece
-PIECE_MASK = 15 # 0b1111
+NUM_PIECES = 16 # 4 bits for piece. piece[3] is side, and piece[0:3] is the piece
 CASTLES_MASK = 15 # 0b1111
-ENPASSANT_MASK = 63 # 0b111111
-
-# BITMAP INDEXES
-BOARD_START = 0
-SIDE_TO_MOVE_START = 256
-CASTLES_START = 257
-ENPASSANT_START = 261
 
 # LOGICAL CONSTANTS, MAPS AND LISTS
 PIECE_MAP = {"r":ROOK, "b":BISHOP, "n":KNIGHT, "q":QUEEN}
 PIECE_STRING = " pnbrqk"
 # PIECE_STRING = " prbnqk"
-# CASTLE_MOVES = {"e1g1":(7,7), "e8g8":(0,7), "e1c1":(7,0), "e8c8":(0,0)}
-CASTLE_MOVES = {0o20060604: 0o07,  # e8g8 / k / black king-side
-                0o20060204: 0o00,  # e8c8 / q / black queen-side
-                0o20067674: 0o77,  # e1g1 / K / white king-side
-                0o20067274: 0o70}  # e1c3 / Q / white queen-side
-ROOK_DIRS = [(-1,0),(1,0),(0,-1),(0,1)]
-BISHOP_DIRS = [(-1,-1),(-1,1),(1,-1),(1,1)]
-KNIGHT_DIRS = [(-2,-1),(-2,1),(2,-1),(2,1),(-1,-2),(-1,2),(1,-2),(1,2)]
-ROYAL_DIRS = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-DIR_MAP= {ROOK: ROOK_DIRS, BISHOP: BISHOP_DIRS, QUEEN: ROYAL_DIRS, \
-            KNIGHT: KNIGHT_DIRS, KING: ROYAL_DIRS}
+
+def buildFenTable():
+    """
+    Indexed by ord(char) of a FEN placement char: (piece code, squares it
+    takes up). Digits are runs of empty squares and "/" takes up none.
+    """
+    table = [(EMPTY, 0)] * 128
+    for piece in range(PAWN, KING + 1):
+        table[ord(PIECE_STRING[piece])] = (piece, 1)
+        table[ord(PIECE_STRING[piece].upper())] = (piece | 8, 1)
+    for run in range(1, 9):
+        table[ord(str(run))] = (EMPTY, run)
+    return table
+
+FEN_TABLE = buildFenTable()
+# The castles bit for each FEN castling char.
+FEN_CASTLES = {"k": 0b0001, "q": 0b0010, "K": 0b0100, "Q": 0b1000}
+# The rook's (from, to) squares for a castle, indexed by [side][is king-side].
+CASTLE_ROOKS = (((0o00, 0o03), (0o07, 0o05)),  # black: a8d8 / q, h8f8 / k
+                ((0o70, 0o73), (0o77, 0o75)))  # white: a1d1 / Q, h1f1 / K
+
+FULL_BOARD = 0xFFFFFFFFFFFFFFFF
+# Shifting a bitboard by +1 moves pieces towards the h file and by +8 towards
+# rank 1. These masks drop the pieces that wrapped around to the other side.
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+NOT_A_FILE = ~FILE_A & FULL_BOARD
+NOT_H_FILE = ~FILE_H & FULL_BOARD
+NOT_AB_FILE = ~(FILE_A | FILE_A << 1) & FULL_BOARD
+NOT_GH_FILE = ~(FILE_H | FILE_H >> 1) & FULL_BOARD
+
+def knightAttacksOf(bb):
+    """ Every square attacked by the knights in |bb|. """
+    return ((bb << 17 & NOT_A_FILE) | (bb << 15 & NOT_H_FILE) | \
+            (bb << 10 & NOT_AB_FILE) | (bb << 6 & NOT_GH_FILE) | \
+            (bb >> 17 & NOT_H_FILE) | (bb >> 15 & NOT_A_FILE) | \
+            (bb >> 10 & NOT_GH_FILE) | (bb >> 6 & NOT_AB_FILE)) & FULL_BOARD
+
+def kingAttacksOf(bb):
+    """ Every square attacked by the kings in |bb|. """
+    sideways = (bb << 1 & NOT_A_FILE) | (bb >> 1 & NOT_H_FILE)
+    row = bb | sideways
+    return (sideways | row << 8 | row >> 8) & FULL_BOARD
+
+def pawnAttacksOf(bb, side):
+    """ Every square attacked by the pawns in |bb| of |side| (0 black, 1 white). """
+    forward = bb >> 8 if side else bb << 8
+    return ((forward << 1 & NOT_A_FILE) | (forward >> 1 & NOT_H_FILE)) & FULL_BOARD
+
+KNIGHT_ATTACKS = tuple(knightAttacksOf(1 << i) for i in range(NUM_SQUARES))
+KING_ATTACKS = tuple(kingAttacksOf(1 << i) for i in range(NUM_SQUARES))
+# Squares attacked by a pawn, indexed by [side (0 black, 1 white)][square].
+PAWN_ATTACKS = tuple(tuple(pawnAttacksOf(1 << i, side) for i in range(NUM_SQUARES)) \
+                     for side in [0, 1])
+
+def buildMagicTables(directions, magics):
+    """
+    Returns (masks, shifts, tables) for fancy magic bitboards: the attacks of
+    a slider on |index| are
+        tables[index][((occupied & masks[index]) * magics[index] & FULL_BOARD) >> shifts[index]]
+    """
+    masks, shifts, tables = [], [], []
+    for index in range(NUM_SQUARES):
+        mask = relevantOccupancy(index, directions)
+        shift = NUM_SQUARES - bin(mask).count("1")
+        table = [0] * (1 << (NUM_SQUARES - shift))
+        for subset in occupancySubsets(mask):
+            key = (subset * magics[index] & FULL_BOARD) >> shift
+            attacks = rayAttacks(index, subset, directions)
+            # Sliders always attack something, so 0 means the slot is free.
+            assert table[key] in (0, attacks), \
+                "magic for square {} collides, rerun generate_magics.py".format(index)
+            table[key] = attacks
+        masks.append(mask)
+        shifts.append(shift)
+        tables.append(table)
+    return tuple(masks), tuple(shifts), tuple(tables)
+
+ROOK_MASKS, ROOK_SHIFTS, ROOK_TABLES = buildMagicTables(ROOK_DIRS, ROOK_MAGICS)
+BISHOP_MASKS, BISHOP_SHIFTS, BISHOP_TABLES = buildMagicTables(BISHOP_DIRS, BISHOP_MAGICS)
+
+def rookAttacks(index, occupied):
+    return ROOK_TABLES[index][((occupied & ROOK_MASKS[index]) * ROOK_MAGICS[index] \
+                               & FULL_BOARD) >> ROOK_SHIFTS[index]]
+
+def bishopAttacks(index, occupied):
+    return BISHOP_TABLES[index][((occupied & BISHOP_MASKS[index]) * BISHOP_MAGICS[index] \
+                                 & FULL_BOARD) >> BISHOP_SHIFTS[index]]
+
+def queenAttacks(index, occupied):
+    return rookAttacks(index, occupied) | bishopAttacks(index, occupied)
+
+# Attacks of each piece type as (table, isSlider), indexed by [side][type].
+# Slider tables are functions of (index, occupied), the rest are indexed by
+# square, so leapers and pawns stay a plain tuple lookup.
+PIECE_ATTACKS = tuple((None,
+                       (PAWN_ATTACKS[side], False),
+                       (KNIGHT_ATTACKS, False),
+                       (bishopAttacks, True),
+                       (rookAttacks, True),
+                       (queenAttacks, True),
+                       (KING_ATTACKS, False),
+                       None) for side in [0, 1])
+
+def buildBetween():
+    """
+    Returns BETWEEN[a][b], the squares strictly between a and b if they share a
+    rank, file or diagonal, and 0 otherwise.
+    """
+    between = []
+    for a in range(NUM_SQUARES):
+        row = []
+        for b in range(NUM_SQUARES):
+            for attacks in [rookAttacks, bishopAttacks]:
+                if attacks(a, 0) & (1 << b):
+                    row.append(attacks(a, 1 << b) & attacks(b, 1 << a))
+                    break
+            else:
+                row.append(0)
+        between.append(tuple(row))
+    return tuple(between)
+
+BETWEEN = buildBetween()
+
+""" Move generation core: plain functions over ints, bitboards and the mailbox. """
+def attackersOf(pieces, occupied, index, side):
+    """ Bitboard of the enemies of |side| that attack |index|. """
+    enemy = 0 if side else 8
+    queens = pieces[QUEEN | enemy]
+    # Enemy pawns attack from the squares our own pawns would take on.
+    return (KNIGHT_ATTACKS[index] & pieces[KNIGHT | enemy]) | \
+           (KING_ATTACKS[index] & pieces[KING | enemy]) | \
+           (PAWN_ATTACKS[side][index] & pieces[PAWN | enemy]) | \
+           (rookAttacks(index, occupied) & (pieces[ROOK | enemy] | queens)) | \
+           (bishopAttacks(index, occupied) & (pieces[BISHOP | enemy] | queens))
+
+def squareAttacked(pieces, occupied, index, side):
+    """ Whether the enemies of |side| (0 black, 1 white) attack |index|. """
+    return attackersOf(pieces, occupied, index, side) != 0
+
+def attackedSquares(pieces, occupied, side):
+    """ Bitboard of every square the enemies of |side| attack. """
+    enemy = 0 if side else 8
+    attacked = pawnAttacksOf(pieces[PAWN | enemy], side ^ 1) | \
+               knightAttacksOf(pieces[KNIGHT | enemy]) | kingAttacksOf(pieces[KING | enemy])
+    queens = pieces[QUEEN | enemy]
+    for sliders, attacks in [(pieces[ROOK | enemy] | queens, rookAttacks), \
+                             (pieces[BISHOP | enemy] | queens, bishopAttacks)]:
+        while sliders:
+            lsb = sliders & -sliders
+            sliders ^= lsb
+            attacked |= attacks(lsb.bit_length() - 1, occupied)
+    return attacked
+
+def pinRays(pieces, occupied, kingSq, sliderSide, blockers):
+    """
+    Finds the pieces in |blockers| that are the only thing standing between
+    |kingSq| and a slider of |sliderSide| (0 or 8). Returns a dict mapping each
+    one's square to the ray it may stay on, which includes the slider itself.
+    """
+    queens = pieces[QUEEN | sliderSide]
+    snipers = (rookAttacks(kingSq, 0) & (pieces[ROOK | sliderSide] | queens)) | \
+              (bishopAttacks(kingSq, 0) & (pieces[BISHOP | sliderSide] | queens))
+    rays = {}
+    while snipers:
+        lsb = snipers & -snipers
+        snipers ^= lsb
+        ray = BETWEEN[kingSq][lsb.bit_length() - 1]
+        between = ray & occupied
+        if between & blockers and between & (between - 1) == 0:
+            rays[between.bit_length() - 1] = ray | lsb
+    return rays
+
+def appendTargetMoves(moves, squares, piece, index, targets):
+    """ Appends a move of |piece| from |index| to every square in |targets|. """
+    # See MOVE BIT MAPS. The source half is the same for every move.
+    srcPart = (piece & 7) << SRC_PIECE | index
+    capture = CAPTURE << MOVE_META
+    while targets:
+        lsb = targets & -targets
+        targets ^= lsb
+        destSq = lsb.bit_length() - 1
+        destPiece = squares[destSq]
+        if destPiece:
+            moves.append(capture | (destPiece & 7) << DEST_PIECE | destSq << DEST_SQ | srcPart)
+        else:
+            moves.append(destSq << DEST_SQ | srcPart)
+    return moves
+
+# ZOBRIST KEYS (fixed seed, so hashes are the same from run to run)
+zobristRng = random.Random(42)
+# Indexed by [piece][square]. Unused piece codes (like EMPTY) hash to 0.
+ZOBRIST_PIECES = [[0] * NUM_SQUARES if p & 7 in [EMPTY, 7] else \
+                  [zobristRng.getrandbits(64) for _ in range(NUM_SQUARES)] \
+                  for p in range(NUM_PIECES)]
+ZOBRIST_WHITE = zobristRng.getrandbits(64)
+ZOBRIST_CASTLES = [zobristRng.getrandbits(64) for _ in range(CASTLES_MASK + 1)]
+# Indexed by en passant square, 0 meaning none.
+ZOBRIST_ENPASSANT = [0] + [zobristRng.getrandbits(64) for _ in range(NUM_SQUARES - 1)]
+
+# Legal moves of positions we've already seen, keyed by Zobrist hash. Cleared
+# when it fills up, which is cheaper than keeping it in LRU order.
+LEGAL_MOVE_CACHE_SIZE = 1 << 16
+legalMoveCache = {}
 
 # MOVE BIT MAPS
 # | meta (4) | promotion (3) | dest piece (3) | src piece (3) | dest sq (6) | src sq (6) |
@@ -73,84 +257,104 @@ CAPTURE      = 0b00001
 CASTLE       = 0b00010
 CHECK        = 0b00100
 PROMOTION    = 0b01000
+# The meta and promotion bits of each promotion move, best piece first.
+PROMOTION_PARTS = [PROMOTION << MOVE_META | promo << PROMO_PIECE \
+                   for promo in [QUEEN, ROOK, BISHOP, KNIGHT]]
 
 class BitBoard():
     """
     The paper said we need 768 bits? 2 x 6 x 64
-    But we don't need a different bit for each piece... there are 6 possible
-    pieces, so we only need 3 bits, plus one bit to represent side.
+    That's what we do now: one 64-bit int per piece (indexed by the 4 bit piece
+    code, so 0, 7, 8 and 15 are unused), where bit i is set if that piece is on
+    square i (0 is a8, 63 is h1). A 64 square mailbox sits next to them so we
+    can still look up what's on a given square in one step.
 
-    total: 267 bits
-    |  en passant (6 bits)  | castles (4 bits) | side to move (1 bit) | board (4x64=256 bits) |
-    |266                 261|260            257|256                256|255                   0|
+    |  en passant (6 bits)  | castles (4 bits) | side to move (1 bit) |
+    are each kept as their own int.
     """
-    # TODO: move the board to the lowest bits to get rid of all the unnecessary shifts.
-    def __init__(self, bits):
-        assert(isinstance(bits, int))
-        self._bits = bits
+    def __init__(self, pieces=None, whiteToMove=True, castles=0, enpassant=0, squares=None, \
+                 kingSquares=None, zobrist=None, occupancy=None):
+        """
+        Params:
+            pieces: list of NUM_PIECES bitboards, indexed by piece code.
+            squares: bytearray of the piece code on each square. Must match
+                     |pieces|. Both default to an empty board.
+            kingSquares: [black king index, white king index], -1 if missing.
+                         Looked up from |pieces| if not given.
+            zobrist: the Zobrist hash of the position. Computed if not given.
+            occupancy: [black pieces, white pieces] bitboards. Computed from
+                       |pieces| if not given.
+        """
+        self._pieces = pieces if pieces is not None else [0] * NUM_PIECES
+        self._squares = squares if squares is not None else bytearray(NUM_SQUARES)
         self._legalMoves = None
-        self._castles = None
-        self._whiteToMove = None
-        self._sideToMove = None
-        self._enpassant = None
+        self._castles = castles
+        self._whiteToMove = whiteToMove
+        self._sideToMove = 8 if whiteToMove else 0
+        self._enpassant = enpassant
+        if kingSquares is None:
+            kingSquares = [(self._pieces[KING | side] & -self._pieces[KING | side]).bit_length() - 1 \
+                           for side in [0, 8]]
+        self._kingSquares = kingSquares
+        if zobrist is None:
+            zobrist = self.computeZobrist()
+        self._zobrist = zobrist
+        if occupancy is None:
+            self.updateOccupancy()
+        else:
+            self._occupancy = occupancy
+            self._occupied = occupancy[0] | occupancy[1]
+
+    def computeZobrist(self):
+        """ Hashes the position from scratch. makeMove updates it incrementally. """
+        zobrist = ZOBRIST_CASTLES[self._castles] ^ ZOBRIST_ENPASSANT[self._enpassant]
+        if self._whiteToMove:
+            zobrist ^= ZOBRIST_WHITE
+        for index in range(NUM_SQUARES):
+            zobrist ^= ZOBRIST_PIECES[self._squares[index]][index]
+        return zobrist
+
+    def updateOccupancy(self):
+        pieces = self._pieces
+        # Indexed by side, like pieceSide: 0 is black, 1 is white.
+        self._occupancy = [pieces[1] | pieces[2] | pieces[3] | pieces[4] | pieces[5] | pieces[6], \
+                           pieces[9] | pieces[10] | pieces[11] | pieces[12] | pieces[13] | pieces[14]]
+        self._occupied = self._occupancy[0] | self._occupancy[1]
 
     """ ====================== Static helper methods ======================= """
-    def coordToAddress(coord):
-        return PIECE_SIZE * (BOARD_SIZE * coord[0] + coord[1])
-
-    def indexToCoord(index):
-        return (int(index / BOARD_SIZE), index % BOARD_SIZE)
-
     def indexToAlgebraic(index):
-        file = "abcdefgh"[index % BOARD_SIZE]
-        return file + str(8 - int(index / BOARD_SIZE))
-
-    def indexToAddress(index):
-        return PIECE_SIZE * index
+        file = "abcdefgh"[index & 7]
+        return file + str(8 - (index >> 3))
 
     def algebraicToIndex(algebraic):
-        return (BOARD_SIZE*(8-int(algebraic[1]))) + ord(algebraic[0])-ord('a')
-
-    def algebraicToAddress(algebraic):
-        row = 8 - int(algebraic[1])
-        col = ord(algebraic[0]) - ord('a')
-        return PIECE_SIZE * (BOARD_SIZE * row + col)
-
-    def algebraicToCoord(algebraic):
-        return (8 - int(algebraic[1]), ord(algebraic[0]) - ord('a'))
-
-    # Also returns an outOfBounds bool if the addition would be out of bounds
-    # on a normal chess board.
-    def indexPlusCoord(index, coord):
-        result = index + (coord[0] * BOARD_SIZE) + coord[1]
-        if result < 0 or result > 63:
-            return -1, True
-        col = (index % BOARD_SIZE) + coord[1]
-        return result, (col < 0 or col > 7)
-
-    # Basically only for en passant logic. Returns a 6 bit int, where the
-    # higher 3 bits are for the row, and the lower 3 bits are for the col.
-    def algebraicToBits(algebraic):
-        return ((8 - int(algebraic[1])) << 3) + (ord(algebraic[0]) - ord('a'))
-
-    def indexToBits(index):
-        return ((8 - int(algebraic[1])) << 3) + (ord(algebraic[0]) - ord('a'))
-
-    def pieceAtAlgebraic(bits, algebraic):
-        i = BitBoard.algebraicToAddress(algebraic[0:2])
-        return (bits & (PIECE_MASK << i)) >> i
-
-    def getPiece(bits, index):
-        shift = PIECE_SIZE * index
-        return (bits & (PIECE_MASK << shift)) >> shift
-
-    def removePiece(bits, address):
-        return bits & ~(PIECE_MASK << address)
-
-    def addPiece(bits, address, piece):
-        # Need to remove piece, if there is already a piece there
-        bits = BitBoard.removePiece(bits, address)
-        return bits | (piece << address)
+        return ((8 - int(algebraic[1])) << 3) + ord(algebraic[0]) - ord('a')
+
+    # removePiece, addPiece and movePiece return what to XOR into the Zobrist
+    # hash. We always know whether a square is taken, so flipping its bit with
+    # an XOR is enough: remove only from taken squares, add only to empty ones.
+    def removePiece(pieces, squares, occupancy, index):
+        piece = squares[index]
+        bit = 1 << index
+        pieces[piece] ^= bit
+        occupancy[piece >> 3] ^= bit
+        squares[index] = EMPTY
+        return ZOBRIST_PIECES[piece][index]
+
+    def addPiece(pieces, squares, occupancy, index, piece):
+        bit = 1 << index
+        pieces[piece] ^= bit
+        occupancy[piece >> 3] ^= bit
+        squares[index] = piece
+        return ZOBRIST_PIECES[piece][index]
+
+    def movePiece(pieces, squares, occupancy, src, dest):
+        piece = squares[src]
+        bits = (1 << src) | (1 << dest)
+        pieces[piece] ^= bits
+        occupancy[piece >> 3] ^= bits
+        squares[src] = EMPTY
+        squares[dest] = piece
+        return ZOBRIST_PIECES[piece][src] ^ ZOBRIST_PIECES[piece][dest]
 
     def pieceType(piece):
         return piece & 7
@@ -158,9 +362,6 @@ class BitBoard():
     def pieceSide(piece):
         return (piece & 8) >> 3
 
-    def areEnemies(p1, p2):
-        return BitBoard.pieceSide(p1) != BitBoard.pieceSide(p2)
-
     def isBackRank(index):
         return index < 8 or index >= 56
 
@@ -171,25 +372,18 @@ class BitBoard():
 
     def createFromFen(fenstring):
         fenArr = fenstring.split(" ")
-        rows = fenArr[0].split("/")
-        pieceMap = {"p": PAWN, "r": ROOK, "b": BISHOP, "n": KNIGHT, "q": QUEEN, "k": KING}
-        bits = 0
-        address = BOARD_START
-        for r in range(len(rows)):
-            empties = 0
-            for c in range(len(rows[r])):
-                if rows[r][c].isdigit():   # Empty squares
-                    address += PIECE_SIZE * int(rows[r][c])
-                    continue
-                # Black = 0, White = 1
-                player = 0 if rows[r][c].islower() else 1
-                piece = (player << 3) | pieceMap[rows[r][c].lower()]
-                bits |= piece << address
-                address += PIECE_SIZE
-
-        # SIDE TO MOVE: 0 is black, 1 is white
-        if fenArr[1] == "w":
-            bits |= 1 << SIDE_TO_MOVE_START
+        pieces = [0] * NUM_PIECES
+        squares = bytearray(NUM_SQUARES)
+        occupancy = [0, 0]
+        index = 0
+        for ch in fenArr[0]:
+            piece, width = FEN_TABLE[ord(ch)]
+            if piece:
+                BitBoard.addPiece(pieces, squares, occupancy, index, piece)
+            index += width
+
+        # SIDE TO MOVE
+        whiteToMove = fenArr[1] == "w"
 
         # CASTLES:
         #   k (black king-side):  0  (0b00)
@@ -198,46 +392,35 @@ class BitBoard():
         #   Q (white queen-side): 3  (0b11)
         castles = 0
         for castle in fenArr[2]:
-            tmp = 0b0001 if castle.islower() else 0b0100
-            if castle.lower() == "k":
-                castles |= tmp
-            elif castle.lower() == "q":
-                castles |= tmp << 1
-        bits |= castles << CASTLES_START
+            castles |= FEN_CASTLES.get(castle, 0)
 
         # EN PASSANT:
         #  | index (0-64, 6 bits) |
+        enpassant = 0
         if (fenArr[3] != "-"):
-            bits |= BitBoard.algebraicToIndex(fenArr[3]) << ENPASSANT_START
+            enpassant = BitBoard.algebraicToIndex(fenArr[3])
 
-        return BitBoard(bits)
+        return BitBoard(pieces, whiteToMove, castles, enpassant, squares, occupancy=occupancy)
 
     """ Getters """
+    def getPiece(self, index):
+        return self._squares[index]
+
+    def pieceAtAlgebraic(self, algebraic):
+        return self._squares[BitBoard.algebraicToIndex(algebraic[0:2])]
+
     def getCastles(self):
-        if self._castles is not None:
-            return self._castles
-        self._castles = (self._bits & (CASTLES_MASK << CASTLES_START)) >> CASTLES_START
         return self._castles
 
     # This is more useful as syntactic sugar for if statements.
     def whiteToMove(self):
-        if self._whiteToMove is not None:
-            return self._whiteToMove
-        self._whiteToMove = (self._bits & (1 << SIDE_TO_MOVE_START)) >> SIDE_TO_MOVE_START
         return self._whiteToMove
 
     # This is more useful when creating a piece.
     def sideToMove(self):
-        if self._sideToMove is not None:
-            return self._sideToMove
-        # 256 (SIDE_TO_MOVE_START) - 3 (PIECE BITS)
-        self._sideToMove = (self._bits & (1 << SIDE_TO_MOVE_START)) >> 253
         return self._sideToMove
 
     def getEnpassant(self):
-        if self._enpassant is not None:
-            return self._enpassant
-        self._enpassant = (self._bits & (ENPASSANT_MASK << ENPASSANT_START)) >> ENPASSANT_START
         return self._enpassant
 
     def getLegalMoves(self):
@@ -254,54 +437,67 @@ class BitBoard():
     def activePieces(self):
         whitePieces = []
         blackPieces = []
-        for i in range(NUM_SQUARES):
-            address = i * PIECE_SIZE
-            piece = (self._bits & (PIECE_MASK << address)) >> address
-            if piece == 0:
+        for piece in range(NUM_PIECES):
+            if BitBoard.pieceType(piece) in [EMPTY, 7]:
                 continue
-            if (8 & piece) == 0:
-                blackPieces.append((BitBoard.pieceType(piece), i))
-                continue
-            whitePieces.append((BitBoard.pieceType(piece), i))
+            pieceList = whitePieces if piece & 8 else blackPieces
+            bb = self._pieces[piece]
+            while bb:
+                lsb = bb & -bb
+                bb ^= lsb
+                pieceList.append((BitBoard.pieceType(piece), lsb.bit_length() - 1))
         return (whitePieces, blackPieces)
 
-    def castleLogic(self, move, piece, bits):
-        newCastles = self.getCastles()
+    def castleLogic(self, move, piece, pieces, squares, occupancy):
+        """ Returns the new castles and the Zobrist hash change for the rook. """
+        whiteToMove = self._whiteToMove
+        newCastles = self._castles
+        zobrist = 0
+        src = move & MOVE_SQ_MASK
+        dest = (move & (MOVE_SQ_MASK << DEST_SQ)) >> DEST_SQ
         if BitBoard.pieceType(piece) == KING:
-            if move in CASTLE_MOVES:
-                rookIndex = CASTLE_MOVES[move]
-                bits = BitBoard.removePiece(bits, rookIndex * PIECE_SIZE)
-                newCol = 5 if ((rookIndex & 0b111) == 7) else 3
-                rookDest = (rookIndex & (0b111 << 3)) | newCol
-                # BitBoard.coordToAddress((rook[0], newFile))
-                bits = BitBoard.addPiece(bits, \
-                    rookDest * PIECE_SIZE, ROOK | self.sideToMove())
+            # Only castling moves the king two squares.
+            if abs(dest - src) == 2:
+                rookFrom, rookTo = CASTLE_ROOKS[whiteToMove][dest > src]
+                zobrist ^= BitBoard.movePiece(pieces, squares, occupancy, rookFrom, rookTo)
             # Even if not castling, moving king cancels all castle possibility.
-            newCastles &= ~(0b11 << (2 if self.whiteToMove() else 0))
-
-        # If our rook moves, remove that castle possibility
-        if BitBoard.pieceType(piece) == ROOK:
-            shift = (2 if self.whiteToMove() else 0) + \
-                    (0 if (move & 0b111) == 7 else 1)
+            newCastles &= ~(0b11 << (2 if whiteToMove else 0))
+
+        # If our rook moves off its starting square, remove that castle possibility
+        ourRow = 7 if whiteToMove else 0
+        if BitBoard.pieceType(piece) == ROOK and (src >> 3) == ourRow \
+                and (src & 0b111) in [0, 7]:
+            shift = (2 if whiteToMove else 0) + \
+                    (0 if (src & 0b111) == 7 else 1)
             newCastles &= ~(0b1 << shift)
 
         # If we just took on a starting rook square, remove opponent's castle possibility
-        oppRow = 7 if self.whiteToMove() else 0
-        destRow = (move & (0b111 << 9)) >> 9
-        if destRow == oppRow:
-            shift = (0 if self.whiteToMove() else 2) + \
-                    (0 if (move & 0b111) == 7 else 1)
+        oppRow = 0 if whiteToMove else 7
+        if (dest >> 3) == oppRow and (dest & 0b111) in [0, 7]:
+            shift = (0 if whiteToMove else 2) + \
+                    (0 if (dest & 0b111) == 7 else 1)
             newCastles &= ~(0b1 << shift)
-        bits &= ((newCastles << CASTLES_START) | ~(CASTLES_MASK << CASTLES_START))
-        return bits
+        return newCastles, zobrist
 
     def makeMove(self, move):
         """
-        |move| should be a string of length 4 or 5 representing the piece to be
-        moved and its end location.
+        |move| is either a move int from getLegalMoves, or a string of length 4
+        or 5 representing the piece to be moved and its end location.
             <init file><init rank><dest file><dest rank>
+        Returns the board after the move, leaving this one as it is.
+        """
+        board = BitBoard(self._pieces[:], self._whiteToMove, self._castles, self._enpassant, \
+                         bytearray(self._squares), self._kingSquares, self._zobrist, \
+                         self._occupancy[:])
+        board.makeMoveInPlace(move)
+        return board
+
+    def makeMoveInPlace(self, move):
+        """
+        Plays |move| (same as for makeMove) on this board itself, and returns
+        the undo info to hand to unmakeMove to take it back. Saves building a
+        new board when we only want to look at the position for a moment.
         """
-        newBits = 0
         if isinstance(move, str):
             src = BitBoard.algebraicToIndex(move[0:2])
             dest = BitBoard.algebraicToIndex(move[2:4])
@@ -313,8 +509,12 @@ class BitBoard():
             dest = ((MOVE_SQ_MASK << DEST_SQ) & move) >> DEST_SQ
             promo = ((MOVE_PIECE_MASK << PROMO_PIECE) & move) >> PROMO_PIECE
 
-        srcAddr = src * PIECE_SIZE
-        srcPiece = BitBoard.getPiece(self._bits, src)
+        whiteToMove = self._whiteToMove
+        enpassant = self._enpassant
+        pieces = self._pieces
+        squares = self._squares
+        occupancy = self._occupancy
+        srcPiece = squares[src]
         endPiece = srcPiece
 
         # Right now, keep the legality checks simple and just trust in the GUI
@@ -324,236 +524,327 @@ class BitBoard():
             self.prettyPrintVerbose()
             print("Illegal move: " + oct(move))
 
-        newBits = BitBoard.removePiece(self._bits, srcAddr)
-        newBits = self.castleLogic(move, srcPiece, newBits)
+        zobrist = self._zobrist ^ ZOBRIST_WHITE
+        capturedSq = dest
+        # En passant logic
+        if BitBoard.pieceType(srcPiece) == PAWN and enpassant and dest == enpassant:
+            # captured piece is on same row as src, and same col as dest.
+            capturedSq = (src & (0b111 << 3)) | (dest & 0b111)
+        captured = squares[capturedSq]
+        if captured:
+            zobrist ^= BitBoard.removePiece(pieces, squares, occupancy, capturedSq)
+        newCastles, rookZobrist = self.castleLogic(move, srcPiece, pieces, squares, occupancy)
+        zobrist ^= rookZobrist ^ ZOBRIST_CASTLES[self._castles] ^ ZOBRIST_CASTLES[newCastles]
 
         # Pawn promotion logic
         if BitBoard.pieceType(srcPiece) == PAWN and (dest <= 0o07 or dest >= 0o70):
-            endPiece = (QUEEN if promo > 0 else promo) | self.sideToMove()
+            endPiece = (promo if promo > 0 else QUEEN) | self._sideToMove
 
-        # En passant logic
-        if BitBoard.pieceType(srcPiece) == PAWN and dest == self.getEnpassant():
-            # captured piece is on same row as src, and same col as dest.
-            capturedAddr = ((src & (0b111 << 3)) | (dest & 0b111)) * PIECE_SIZE
-            newBits = BitBoard.removePiece(newBits, capturedAddr)
-
-        newBits &= ~(ENPASSANT_MASK << ENPASSANT_START)
+        newEnpassant = 0
         doubleAdvance = abs(src - dest) == 0o20
         if BitBoard.pieceType(srcPiece) == PAWN and doubleAdvance:
-            epRow = 0o50 if self.whiteToMove() else 0o20
-            newBits |= (epRow | (src & 0b111)) << ENPASSANT_START
+            epRow = 0o50 if whiteToMove else 0o20
+            newEnpassant = epRow | (src & 0b111)
 
-        destAddr = dest * PIECE_SIZE
-        newBits = BitBoard.addPiece(newBits, destAddr, endPiece)
+        if endPiece == srcPiece:
+            zobrist ^= BitBoard.movePiece(pieces, squares, occupancy, src, dest)
+        else:
+            zobrist ^= BitBoard.removePiece(pieces, squares, occupancy, src)
+            zobrist ^= BitBoard.addPiece(pieces, squares, occupancy, dest, endPiece)
+        zobrist ^= ZOBRIST_ENPASSANT[enpassant] ^ ZOBRIST_ENPASSANT[newEnpassant]
 
-        # Flip whose turn it is.
-        newBits ^= (1 << SIDE_TO_MOVE_START)
+        undo = (move, srcPiece, captured, capturedSq, self._castles, enpassant, \
+                self._zobrist, self._kingSquares, self._legalMoves)
+        if BitBoard.pieceType(srcPiece) == KING:
+            # Copied, since boards we were made from may share the list.
+            self._kingSquares = self._kingSquares[:]
+            self._kingSquares[BitBoard.pieceSide(srcPiece)] = dest
 
-        return BitBoard(newBits)
+        # Flip whose turn it is.
+        self._whiteToMove = not whiteToMove
+        self._sideToMove ^= 8
+        self._castles = newCastles
+        self._enpassant = newEnpassant
+        self._zobrist = zobrist
+        self._occupied = occupancy[0] | occupancy[1]
+        self._legalMoves = None
+        return undo
+
+    def unmakeMove(self, undo):
+        """ Takes back the makeMoveInPlace that returned |undo|. """
+        move, srcPiece, captured, capturedSq, castles, enpassant, zobrist, kingSquares, \
+            legalMoves = undo
+        pieces = self._pieces
+        squares = self._squares
+        occupancy = self._occupancy
+        src = move & MOVE_SQ_MASK
+        dest = (move >> DEST_SQ) & MOVE_SQ_MASK
+
+        # The same XORs as on the way in undo them again.
+        if squares[dest] == srcPiece:
+            BitBoard.movePiece(pieces, squares, occupancy, dest, src)
+        else:
+            BitBoard.removePiece(pieces, squares, occupancy, dest)
+            BitBoard.addPiece(pieces, squares, occupancy, src, srcPiece)
+        if captured:
+            BitBoard.addPiece(pieces, squares, occupancy, capturedSq, captured)
+        if BitBoard.pieceType(srcPiece) == KING and abs(dest - src) == 2:
+            rookFrom, rookTo = CASTLE_ROOKS[BitBoard.pieceSide(srcPiece)][dest > src]
+            BitBoard.movePiece(pieces, squares, occupancy, rookTo, rookFrom)
+
+        self._whiteToMove = not self._whiteToMove
+        self._sideToMove ^= 8
+        self._castles = castles
+        self._enpassant = enpassant
+        self._zobrist = zobrist
+        self._kingSquares = kingSquares
+        self._occupied = occupancy[0] | occupancy[1]
+        self._legalMoves = legalMoves
 
 
     """ ============== Legal Moves calculation ===================== """
     def findPiece(self, piece):
-        shift = BOARD_START
-        while shift < MAX_INDEX:
-            if piece == ((self._bits & (PIECE_MASK << shift)) >> shift):
-                return int(shift / PIECE_SIZE)
-            shift += PIECE_SIZE
-        self.prettyPrintVerbose()
-        raise Exception("Piece not found: " + bin(piece))
-
-    def constructMove(srcSq, destSq, srcPiece, destPiece = 0, meta = 0, promoPiece = 0):
-        srcPiece = BitBoard.pieceType(srcPiece)
-        destPiece = BitBoard.pieceType(destPiece)
-        return meta << MOVE_META | promoPiece << PROMO_PIECE | \
-                destPiece << DEST_PIECE | srcPiece << SRC_PIECE | \
-                destSq << DEST_SQ | srcSq
-
-    def legalMovesForNonPawns(self, piece, index, directions):
-        multiStep = PIECE_STRING[BitBoard.pieceType(piece)] in "rbq"
-        moves = []
-        for d in directions:
-            destSq, outOfBounds = BitBoard.indexPlusCoord(index, d)
-            while multiStep and not outOfBounds \
-                    and BitBoard.getPiece(self._bits, destSq) == 0:
-                # cMove = BitBoard.constructMove(index, destSq, piece)
-                # print("{} {} -> {}: {}".format(bin(piece), oct(index), oct(destSq), oct(cMove)))
-                moves.append(BitBoard.constructMove(index, destSq, piece))
-                destSq, outOfBounds = BitBoard.indexPlusCoord(destSq, d)
-            if outOfBounds:
-                continue
-            destPiece = BitBoard.getPiece(self._bits, destSq)
-            if destPiece != 0 and BitBoard.areEnemies(piece, destPiece):
-                # cMove = BitBoard.constructMove(index, destSq, piece, destPiece, CAPTURE)
-                # print("{} {} -> {}: {}".format(bin(piece), oct(index), oct(destSq), oct(cMove)))
-                moves.append(BitBoard.constructMove(index, destSq, piece, destPiece, CAPTURE))
-                continue
-            if (not multiStep and destPiece == 0):
-                # cMove = BitBoard.constructMove(index, destSq, piece)
-                # print("{} {} -> {}: {}".format(bin(piece), oct(index), oct(destSq), oct(cMove)))
-                moves.append(BitBoard.constructMove(index, destSq, piece, destPiece))
-        return moves
-
-    def legalMovesForPawn(self, pawn, index):
-        moves = []
-        forward = -1 if self.whiteToMove() else 1
-        diagonals = [(forward, -1), (forward, 1)]
+        if BitBoard.pieceType(piece) == KING and self._kingSquares[BitBoard.pieceSide(piece)] >= 0:
+            return self._kingSquares[BitBoard.pieceSide(piece)]
+        pieces = self._pieces[piece]
+        if pieces == 0:
+            self.prettyPrintVerbose()
+            raise Exception("Piece not found: " + bin(piece))
+        return (pieces & -pieces).bit_length() - 1
+
+    # The move generators all append to the |moves| list they're given, so one
+    # list is shared by the whole of computeLegalMoves. They only emit moves
+    # landing on |allowed|, which is how computeLegalMoves keeps pinned pieces
+    # on their pin ray, makes us answer checks and keeps our king out of them.
+    def legalMovesForLeaper(self, piece, index, attacks, moves, allowed):
+        targets = attacks[index] & ~self._occupancy[BitBoard.pieceSide(piece)] & allowed
+        return appendTargetMoves(moves, self._squares, piece, index, targets)
+
+    def legalMovesForSlider(self, piece, index, attacks, moves, allowed):
+        targets = attacks(index, self._occupied) & ~self._occupancy[BitBoard.pieceSide(piece)] \
+                  & allowed
+        return appendTargetMoves(moves, self._squares, piece, index, targets)
+
+    def legalMovesForPawn(self, pawn, index, attacks, moves, allowed):
+        """
+        |attacks| is PAWN_ATTACKS, which is indexed by side first. En passant
+        ignores |allowed| and is checked by kingCheckAnalysis instead.
+        """
+        side = BitBoard.pieceSide(pawn)
+        squares = self._squares
+        # See MOVE BIT MAPS.
+        srcPart = PAWN << SRC_PIECE | index
         # Pawn take logic
-        for diag in diagonals:
-            destSq, outOfBounds = BitBoard.indexPlusCoord(index, diag)
-            if outOfBounds:
-                continue
-            destPiece = BitBoard.getPiece(self._bits, destSq)
-            if destPiece != 0 and BitBoard.areEnemies(pawn, destPiece):
-                if BitBoard.isBackRank(destSq):
-                    for promo in [QUEEN, ROOK, BISHOP, KNIGHT]:
-                        moves.append(BitBoard.constructMove(index, destSq, pawn, destPiece, CAPTURE | PROMOTION, promo))
-                    continue
-                moves.append(BitBoard.constructMove(index, destSq, pawn, destPiece, CAPTURE))
+        attacks = attacks[side][index]
+        takes = attacks & self._occupancy[side ^ 1] & allowed
+        while takes:
+            lsb = takes & -takes
+            takes ^= lsb
+            destSq = lsb.bit_length() - 1
+            move = CAPTURE << MOVE_META | (squares[destSq] & 7) << DEST_PIECE | \
+                   destSq << DEST_SQ | srcPart
+            if BitBoard.isBackRank(destSq):
+                for promo in PROMOTION_PARTS:
+                    moves.append(move | promo)
                 continue
-            if destSq == self.getEnpassant() and destSq > 0:
-                moves.append(BitBoard.constructMove(index, destSq, pawn, PAWN, CAPTURE))
+            moves.append(move)
+        enpassant = self._enpassant
+        if enpassant > 0 and attacks & (1 << enpassant):
+            moves.append(CAPTURE << MOVE_META | PAWN << DEST_PIECE | enpassant << DEST_SQ | srcPart)
 
         # Pawn advance logic
-        destSq, outOfBounds = BitBoard.indexPlusCoord(index, (forward, 0))
-        if outOfBounds or BitBoard.getPiece(self._bits, destSq) != 0:
+        bit = 1 << index
+        empty = ~self._occupied & FULL_BOARD
+        single = (bit >> 8 if side else bit << 8) & empty
+        if not single:
             return moves
-        if BitBoard.isBackRank(destSq):
-            for promo in [QUEEN, ROOK, BISHOP, KNIGHT]:
-                moves.append(BitBoard.constructMove(index, destSq, pawn, destPiece, 0, promo))
-        else:
-            moves.append(BitBoard.constructMove(index, destSq, pawn))
+        destSq = single.bit_length() - 1
+        if single & allowed:
+            if BitBoard.isBackRank(destSq):
+                for promo in PROMOTION_PARTS:
+                    moves.append(promo | destSq << DEST_SQ | srcPart)
+            else:
+                moves.append(destSq << DEST_SQ | srcPart)
 
         # Pawn double advance logic
-        if int(index / BOARD_SIZE) != (6 if self.whiteToMove() else 1):
+        if index >> 3 != (6 if side else 1):
             return moves
-        double = index + (2 * BOARD_SIZE * forward)
-        if BitBoard.getPiece(self._bits, double) == 0:
-            moves.append(BitBoard.constructMove(index, double, pawn))
+        double = (single >> 8 if side else single << 8) & empty & allowed
+        if double:
+            moves.append((double.bit_length() - 1) << DEST_SQ | srcPart)
 
         return moves
 
-    def legalMovesForPiece(self, piece, index):
-        if BitBoard.pieceType(piece) == PAWN:
-            return self.legalMovesForPawn(piece, index)
-        return self.legalMovesForNonPawns(piece, index, \
-            DIR_MAP[BitBoard.pieceType(piece)])
+    def legalMovesForPiece(self, piece, index, moves, allowed=FULL_BOARD):
+        generator, attacks = PIECE_GENERATORS[piece & 7]
+        return generator(self, piece, index, attacks, moves, allowed)
 
-    def legalCastleMoves(self):
+    def legalCastleMoves(self, moves, kingDanger):
+        """ |kingDanger| is every square the opponent attacks. """
         castleMap = {1: 0o20060604,  # e8g8 / k / black king-side
                      2: 0o20060204,  # e8c8 / q / black queen-side
                      4: 0o20067674,  # e1g1 / K / white king-side
                      8: 0o20067274}  # e1c3 / Q / white queen-side
-        moves = []
+        whiteToMove = self._whiteToMove
+        castles = self._castles
+        row = 56 if whiteToMove else 0   # Our back rank
         for shift in range(2):
-            mask = 1 << (shift + (2 if self.whiteToMove() else 0))
-            castle = self.getCastles() & mask
+            mask = 1 << (shift + (2 if whiteToMove else 0))
+            castle = castles & mask
             if castle == 0:
                 continue
             isKingside = (shift == 0)
             # Check squares between king and rook
-            emptyMask = 255 if isKingside else 4095
-            shift = (56 * PIECE_SIZE if self.whiteToMove() else 0) \
-                    + (20 if isKingside else 4)
-            if (self._bits & (emptyMask << shift)) != 0:
+            emptyMask = (0b11 << 5 if isKingside else 0b111 << 1) << row
+            if self._occupied & emptyMask:
                 continue
 
-            # Check that all transit squares are not attacked
-            transits = [4,5,6] if isKingside else [2,3,4]
-            row = 56 if self.whiteToMove() else 0
-            if any([self.isSquareAttacked(t + row, (self.sideToMove() | KING)) \
-                    for t in transits]):
+            # Check that all transit squares (e to g, or c to e) are not attacked
+            transits = (0b111 << 4 if isKingside else 0b111 << 2) << row
+            if kingDanger & transits:
                 continue
             moves.append(castleMap[castle])
         return moves
 
-    def isSquareAttackedByPiece(self, index, target, directions, pieces):
-        multiStep = any([p in pieces for p in "rbq"])
-        for d in directions:
-            tmp, outOfBounds = BitBoard.indexPlusCoord(index, d)
-            while multiStep and not outOfBounds \
-                    and BitBoard.getPiece(self._bits, tmp) == 0:
-                tmp, outOfBounds = BitBoard.indexPlusCoord(tmp, d)
-            if outOfBounds:
-                continue
-            piece = BitBoard.getPiece(self._bits, tmp)
-            pieceStr = PIECE_STRING[BitBoard.pieceType(piece)]
-            if pieceStr in pieces and BitBoard.areEnemies(piece, target):
-                return True
-        return False
-
     def isSquareAttacked(self, index, target = None):
         """
         If target is None, will use whatever piece is at the index.
         """
-        directionals = [(KNIGHT_DIRS, "n"), (ROOK_DIRS, "rq"), \
-                        (BISHOP_DIRS, "bq"), (ROYAL_DIRS, "k")]
         if target is None:
-            target = BitBoard.getPiece(self._bits, index)
-        if any([self.isSquareAttackedByPiece(index, target, dir, ps) \
-                for (dir, ps) in directionals]):
-            return True
-        # Pawn logic is special
-        forward = 1 if self.whiteToMove() else -1
-        diagonals = [(forward, 1), (forward, -1)]
-        for diag in diagonals:
-            tmp, outOfBounds = BitBoard.indexPlusCoord(index, diag)
-            if outOfBounds:
-                continue
-            piece = BitBoard.getPiece(self._bits, tmp)
-            if BitBoard.pieceType(piece) == PAWN and BitBoard.areEnemies(piece, target):
-                return True
-        return False
+            target = self.getPiece(index)
+        return squareAttacked(self._pieces, self._occupied, index, BitBoard.pieceSide(target))
 
     def isKingSafeAfterMove(self, move):
-        postMoveBoard = self.makeMove(move)
         king = self.sideToMove() | KING
+        undo = self.makeMoveInPlace(move)
+        safe = not self.isSquareAttacked(self.findPiece(king), king)
+        self.unmakeMove(undo)
+        return safe
 
-        kingIndex = postMoveBoard.findPiece(king)
-        return not postMoveBoard.isSquareAttacked(kingIndex, king)
+    def checkAnalysisByMakeMove(self, move):
+        """
+        The slow path for the moves kingCheckAnalysis can't reason about with
+        pins alone (en passant and castling). Returns None if |move| is illegal.
+        """
+        ourKing = KING | self._sideToMove
+        otherKing = ourKing ^ 8
+        undo = self.makeMoveInPlace(move)
+        if self.isSquareAttacked(self.findPiece(ourKing), ourKing):
+            move = None
+        elif self.isSquareAttacked(self.findPiece(otherKing), otherKing):
+            move |= CHECK << MOVE_META
+        self.unmakeMove(undo)
+        return move
 
     def kingCheckAnalysis(self, moves):
-        newMoves = []
+        """
+        Flags the checks among |moves|, which the generators already kept
+        legal, apart from en passant. Drops en passant captures that turn out
+        to be illegal.
+        """
+        pieces = self._pieces
+        occupied = self._occupied
+        sideToMove = self._sideToMove
+        enpassant = self._enpassant
+        us = BitBoard.pieceSide(sideToMove)
+        theirKingSq = self.findPiece(KING | (0 if us else 8))
+        theirKing = 1 << theirKingSq
+
+        # Our pieces that would uncover a check on their king if they stepped
+        # off the line.
+        discoverers = pinRays(pieces, occupied, theirKingSq, sideToMove, self._occupancy[us])
+        pieceAttacks = PIECE_ATTACKS[us]
+
+        kept = 0
         for move in moves:
-            postMoveBoard = self.makeMove(move)
-            ourKing = KING | self.sideToMove()
-            ourKingIndex = postMoveBoard.findPiece(ourKing)
-            if postMoveBoard.isSquareAttacked(ourKingIndex, ourKing):
-                # Get rid of moves that leave our king in check
-                continue
-            otherKing = KING | (0 if self.whiteToMove() else 8)
-            otherKingIndex = postMoveBoard.findPiece(otherKing)
-            if postMoveBoard.isSquareAttacked(otherKingIndex, otherKing):
-                newMoves.append(move | (CHECK << MOVE_META))
+            src = move & MOVE_SQ_MASK
+            dest = (move >> DEST_SQ) & MOVE_SQ_MASK
+            srcPiece = (move >> SRC_PIECE) & MOVE_PIECE_MASK
+            destBit = 1 << dest
+            if (move >> MOVE_META) & CASTLE or \
+                    (srcPiece == PAWN and dest == enpassant and enpassant):
+                move = self.checkAnalysisByMakeMove(move)
+                if move is None:
+                    continue
+                moves[kept] = move
+                kept += 1
                 continue
-            newMoves.append(move)
-        return newMoves
+            afterOccupied = (occupied & ~(1 << src)) | destBit
+
+            # Direct check from the moved (or promoted) piece, or discovered
+            # check from the slider it was blocking.
+            endPiece = (move >> PROMO_PIECE) & MOVE_PIECE_MASK or srcPiece
+            attacks, isSlider = pieceAttacks[endPiece]
+            if isSlider:
+                check = attacks(dest, afterOccupied) & theirKing
+            else:
+                check = attacks[dest] & theirKing
+            if check or (src in discoverers and not destBit & discoverers[src]):
+                move |= CHECK << MOVE_META
+            moves[kept] = move
+            kept += 1
+        del moves[kept:]
+        return moves
 
 
     # Only for if the active player's king is in check mate, since it can't be
     # checkmate when it's not your turn.
     def isCheckMate(self):
-        # try:
         kingIndex = self.findPiece(self.sideToMove() | KING)
-        return len(self.getLegalMoves()) == 0 and self.isSquareAttacked(kingIndex)
-        # except:
-        #     self.prettyPrintVerbose()
-        #     return True
+        return self.isSquareAttacked(kingIndex) and len(self.getLegalMoves()) == 0
 
     def computeLegalMoves(self):
         if self._legalMoves is not None:
             return
+        # Transpositions share the cached list, so callers must not modify it.
+        cached = legalMoveCache.get(self._zobrist)
+        if cached is not None:
+            self._legalMoves = cached
+            return
+        pieces = self._pieces
+        occupied = self._occupied
+        us = BitBoard.pieceSide(self._sideToMove)
+        own = self._occupancy[us]
+        kingSq = self.findPiece(KING | self._sideToMove)
+
+        # Work out once what every move must respect, so the generators only
+        # emit legal moves: pins to our king, answering a check, and squares
+        # our king can't step on (found with the king lifted off the board, so
+        # it can't hide behind itself from a slider).
+        pinned = pinRays(pieces, occupied, kingSq, 0 if us else 8, own)
+        checkers = attackersOf(pieces, occupied, kingSq, us)
+        if checkers & (checkers - 1):
+            evasions = 0      # Double check: only the king can move.
+        elif checkers:
+            evasions = checkers | BETWEEN[kingSq][checkers.bit_length() - 1]
+        else:
+            evasions = FULL_BOARD
+        kingDanger = attackedSquares(pieces, occupied ^ (1 << kingSq), us)
+
         moves = []
-        for i in range(NUM_SQUARES):
-            piece = BitBoard.getPiece(self._bits, i)
-            if piece == 0 or self.isOpponentPiece(piece):
-                continue
-            moves += self.legalMovesForPiece(piece, i)
-        moves += self.legalCastleMoves()
-        moves = self.kingCheckAnalysis(moves)
-        moves.sort(key=(lambda m: m & (MOVE_META_MASK << MOVE_META)), reverse=True)
-        # self._legalMoves = [m[0] for m in moves]
+        while own:
+            lsb = own & -own
+            own ^= lsb
+            i = lsb.bit_length() - 1
+            if i == kingSq:
+                allowed = ~kingDanger & FULL_BOARD
+            elif i in pinned:
+                allowed = evasions & pinned[i]
+            else:
+                allowed = evasions
+            if allowed:
+                self.legalMovesForPiece(self._squares[i], i, moves, allowed)
+        if not checkers:
+            self.legalCastleMoves(moves, kingDanger)
+        self.kingCheckAnalysis(moves)
+        # Meta flags are the top bits of a move, followed by the promotion and the
+        # captured piece, so plain int order puts promotions, checks and
+        # captures first, and bigger captures (MVV) before smaller ones.
+        moves.sort(reverse=True)
         self._legalMoves = moves
+        if len(legalMoveCache) >= LEGAL_MOVE_CACHE_SIZE:
+            legalMoveCache.clear()
+        legalMoveCache[self._zobrist] = moves
 
     """ ============== Debugging and Printing ===================== """
     def moveToDebugString(move):
@@ -562,7 +853,7 @@ class BitBoard():
         srcPiece = (move & (MOVE_PIECE_MASK << SRC_PIECE)) >> SRC_PIECE
         destPiece = (move & (MOVE_PIECE_MASK << DEST_PIECE)) >> DEST_PIECE
         meta = (move & (MOVE_META_MASK << MOVE_META)) >> MOVE_META
-        pieces = ["", "p", "R", "B", "N", "Q", "K"]
+        pieces = ["", "p", "N", "B", "R", "Q", "K"]
         return "{}{}->{}{}{}".format(pieces[srcPiece], src, pieces[destPiece], dest, \
             " " + bin(meta)[2:] if meta > 0 else "")
 
@@ -570,49 +861,52 @@ class BitBoard():
         src = BitBoard.indexToAlgebraic(move & MOVE_SQ_MASK)
         dest = BitBoard.indexToAlgebraic((move & (MOVE_SQ_MASK << DEST_SQ)) >> DEST_SQ)
         promo = (move & (MOVE_PIECE_MASK << PROMO_PIECE)) >> PROMO_PIECE
-        pieces = ["", "", "r", "b", "n", "q", ""]
-        return "{}{}{}".format(src, dest, pieces[promo])
+        return "{}{}{}".format(src, dest, PIECE_STRING[promo].strip())
 
     def printLegalMoves(self):
         print([BitBoard.moveToDebugString(m) for m in self.getLegalMoves()])
 
     def prettyPrint(self):
         for i in range(NUM_SQUARES):
-            if i % BOARD_SIZE == 0:
+            if i & 7 == 0:
                 print("|", end='')
-            bitmask = 15 << (i * PIECE_SIZE)
-            pieceBits = (self._bits & bitmask) >> (i * PIECE_SIZE)
+            pieceBits = self._squares[i]
             piece = PIECE_STRING[pieceBits & 7]
             whiteToPlay = pieceBits & 8
             piece = piece.upper() if whiteToPlay else piece
-            if i % BOARD_SIZE != 0:
+            if i & 7 != 0:
                 print(piece.rjust(2), end='')
             else:
                 print(piece, end='')
-            if i % BOARD_SIZE == 7:
+            if i & 7 == 7:
                 print("|")
 
     def prettyPrintVerbose(self):
         print("PRETTY PRINT ==================")
-        print("Board bits as int: {}".format(self._bits))
-        binary = format(self._bits, '#0269b')
-        print("Board bits binary: " + binary)
-        strStart = 2
-        print("  En Passant[261:266]: {}".format(binary[strStart:strStart + 6]))
-
-        castles = strStart + 6
-        print("  Castles[257:261]:    {}".format(binary[castles:castles+4]))
-        print("  Side to move[256]:   {}".format(binary[castles+4]))
-        print("  Board [0:256]: (is reflected across y=-x compared to normal board)")
-        board = castles + 5
-        for i in range(BOARD_SIZE):
-            start = board + i * PIECE_SIZE * BOARD_SIZE
-            end = board + (i + 1) * PIECE_SIZE * BOARD_SIZE
-            print("    {}".format(binary[start:end]))
+        print("  En Passant:   {}".format(self.getEnpassant()))
+        print("  Castles:      {}".format(format(self.getCastles(), '04b')))
+        print("  Side to move: {}".format("white" if self.whiteToMove() else "black"))
+        print("  Piece bitboards:")
+        for piece in range(NUM_PIECES):
+            if BitBoard.pieceType(piece) in [EMPTY, 7]:
+                continue
+            name = PIECE_STRING[piece & 7]
+            name = name.upper() if piece & 8 else name
+            print("    {}: {}".format(name, format(self._pieces[piece], '#066b')))
         print("  Board (fancy):")
         self.prettyPrint()
         print()
 
+# Move generator and its attack table (or function) for each piece type.
+PIECE_GENERATORS = (None,
+                    (BitBoard.legalMovesForPawn, PAWN_ATTACKS),
+                    (BitBoard.legalMovesForLeaper, KNIGHT_ATTACKS),
+                    (BitBoard.legalMovesForSlider, bishopAttacks),
+                    (BitBoard.legalMovesForSlider, rookAttacks),
+                    (BitBoard.legalMovesForSlider, queenAttacks),
+                    (BitBoard.legalMovesForLeaper, KING_ATTACKS),
+                    None)
+
 if __name__ == "__main__":
     board = BitBoard.createFromFen(TEST_FEN)
     # perft(board, 0, 4)
@@ -0,0 +1,49 @@
+"""
+Finds the magic numbers for bitboard.py's rook and bishop attack tables, by
+trying sparse random numbers until one maps every occupancy of a square to an
+index without a harmful collision. Writes them to magics.py.
+
+    python generate_magics.py
+
+Only needs rerunning if the square numbering in bitboard.py changes.
+"""
+import random
+from sliders import ROOK_DIRS, BISHOP_DIRS, NUM_SQUARES, FULL_BOARD, \
+    rayAttacks, relevantOccupancy, occupancySubsets
+
+MAGICS_FILE = "magics.py"
+
+def findMagic(index, directions, rng):
+    mask = relevantOccupancy(index, directions)
+    shift = NUM_SQUARES - bin(mask).count("1")
+    subsets = occupancySubsets(mask)
+    attacks = [rayAttacks(index, s, directions) for s in subsets]
+    while True:
+        magic = rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)
+        # Quickly skip magics that don't spread the mask into the top bits.
+        if bin((mask * magic) & 0xFF00000000000000).count("1") < 6:
+            continue
+        used = {}
+        for subset, attack in zip(subsets, attacks):
+            key = (subset * magic & FULL_BOARD) >> shift
+            if used.setdefault(key, attack) != attack:
+                break
+        else:
+            return magic
+
+def formatMagics(name, magics):
+    lines = ["{} = (".format(name)]
+    for i in range(0, NUM_SQUARES, 4):
+        lines.append("    " + " ".join("0x{:016X},".format(m) for m in magics[i:i + 4]))
+    lines.append(")")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    rng = random.Random(1)
+    rookMagics = [findMagic(i, ROOK_DIRS, rng) for i in range(NUM_SQUARES)]
+    bishopMagics = [findMagic(i, BISHOP_DIRS, rng) for i in range(NUM_SQUARES)]
+    with open(MAGICS_FILE, "w") as f:
+        f.write('"""\nMagic numbers for the slider attack tables in bitboard.py, indexed by\n'
+                'square (0 is a8, 63 is h1).\n\nGenerated by generate_magics.py, do not edit.\n"""\n')
+        f.write(formatMagics("ROOK_MAGICS", rookMagics) + "\n\n")
+        f.write(formatMagics("BISHOP_MAGICS", bishopMagics) + "\n")
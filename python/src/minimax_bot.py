@@ -24,7 +24,7 @@ PIECE_VALUES = {bitboard.PAWN: 100,
 class MiniMaxEngine:
     def __init__(self):
         self._options = defaultdict(str)
-        self._board = BitBoard(0)
+        self._board = BitBoard()
         self._maxDepth = 3 # in plies
         self._table = {}
         self._moves = 0
@@ -108,27 +108,32 @@ class MiniMaxEngine:
         # print(info['score'])
         print("bestmove " + random.choice(bestMoves))
 
+    def printBoard(self, line):
+        self._board.prettyPrint()
+        print(self._board.getLegalMoves())
+
     def run(self):
+        # UCI command -> handler, which gets the whole input line.
+        commands = {
+            "uci": lambda line: self.inputUCI(),
+            "setoption": self.setOptions,
+            "isready": lambda line: self.isReady(),
+            "ucinewgame": lambda line: self.newGame(),
+            "position": self.position,
+            "go": lambda line: self.go(),
+            "print": self.printBoard,
+        }
         while True:
             line = input()
-            if line == "uci":
-                self.inputUCI()
-            elif line.startswith("setoption"):
-                self.setOptions(line)
-            elif line.startswith("isready"):
-                self.isReady()
-            elif line.startswith("ucinewgame"):
-                self.newGame()
-            elif line.startswith("position"):
-                self.position(line)
-            elif line.startswith("go"):
-                self.go()
-            elif line.startswith("print"):
-                self._board.prettyPrint()
-                print(self._board.getLegalMoves())
-            elif line.startswith("end") or line.startswith("quit"):
+            words = line.split(None, 1)
+            if not words:
+                continue
+            if words[0] in ["end", "quit"]:
                 print("goodbye")
                 break
+            handler = commands.get(words[0])
+            if handler is not None:
+                handler(line)
 
     """ =============== Minimax implementation ====================="""
     def evaluatePosition(board):
@@ -62,12 +62,12 @@ def convertPgnToAlgebraic(line):
             raise e
         possibles = []
         for lm in legalMoves:
-            src = BitBoard.pieceAtAlgebraic(board._bits, lm[0:2])
+            src = board.pieceAtAlgebraic(lm[0:2])
             if lm[-2:] == dest and bitPiece == BitBoard.pieceType(src):
                 possibles.append(lm)
         if len(possibles) == 1:
             lm = possibles[0]
-            src = BitBoard.pieceAtAlgebraic(board._bits, lm[0:2])
+            src = board.pieceAtAlgebraic(lm[0:2])
             board = board.makeMove(possibles[0])
             algebraic.append(possibles[0])
             if bitPiece != BitBoard.pieceType(src):
@@ -0,0 +1,29 @@
+import unittest
+from arrayboard import Array2DBoard
+from bitboard import BitBoard
+from benchmark_board import perft
+
+# (FEN, depth, nodes), from the chessprogramming.org perft results.
+PERFT_POSITIONS = [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 3, 8902),
+    # "Kiwipete": castling, pins, en passant and promotions all at once.
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 2, 2039),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 4, 43238),
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", 3, 9467),
+    ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", 2, 1486),
+]
+
+class TestPerft(unittest.TestCase):
+    def checkPerft(self, boardType):
+        for fen, depth, nodes in PERFT_POSITIONS:
+            with self.subTest(fen=fen, depth=depth):
+                self.assertEqual(perft(boardType.createFromFen(fen), depth), nodes)
+
+    def test_arrayBoard(self):
+        self.checkPerft(Array2DBoard)
+
+    def test_bitBoard(self):
+        self.checkPerft(BitBoard)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,7 +13,7 @@ KING_CHECK_WHITE = "3k4/8/8/8/8/3p4/8/3K4 w - - 1 2"
 class Engine:
     def __init__(self):
         self.options = defaultdict(str)
-        self.board = BitBoard(0)
+        self.board = BitBoard()
 
     def inputUCI(self):
         print("id name " + ENGINE_NAME)
@@ -51,27 +51,32 @@ class Engine:
             return
         print("bestmove " + random.choice(moves))
 
+    def printBoard(self, line):
+        self.board.prettyPrint()
+        print(self.board.getLegalMoves())
+
     def run(self):
+        # UCI command -> handler, which gets the whole input line.
+        commands = {
+            "uci": lambda line: self.inputUCI(),
+            "setoption": self.setOptions,
+            "isready": lambda line: self.isReady(),
+            "ucinewgame": lambda line: self.newGame(),
+            "position": self.position,
+            "go": lambda line: self.go(),
+            "print": self.printBoard,
+        }
         while True:
             line = input()
-            if line == "uci":
-                self.inputUCI()
-            elif line.startswith("setoption"):
-                self.setOptions(line)
-            elif line.startswith("isready"):
-                self.isReady()
-            elif line.startswith("ucinewgame"):
-                self.newGame()
-            elif line.startswith("position"):
-                self.position(line)
-            elif line.startswith("go"):
-                self.go()
-            elif line.startswith("print"):
-                self.board.prettyPrint()
-                print(self.board.getLegalMoves())
-            elif line.startswith("end") or line.startswith("quit"):
+            words = line.split(None, 1)
+            if not words:
+                continue
+            if words[0] in ["end", "quit"]:
                 print("goodbye")
                 break
+            handler = commands.get(words[0])
+            if handler is not None:
+                handler(line)
 
 if __name__ == "__main__":
     engine = Engine()
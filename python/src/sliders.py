@@ -0,0 +1,62 @@
+"""
+Slow, step-by-step slider attack helpers, used to build (and find the magic
+numbers for) the magic bitboard tables in bitboard.py. Kept apart from
+bitboard.py so generate_magics.py can run without an existing magics.py.
+
+Squares are indexed row * 8 + col, 0 is a8 and 63 is h1.
+"""
+from array import array
+
+BOARD_SIZE = 8
+NUM_SQUARES = 64
+FULL_BOARD = 0xFFFFFFFFFFFFFFFF
+
+# Flattened (row step, col step) pairs: dr0, dc0, dr1, dc1, ...
+ROOK_DIRS = array('b', [-1,0, 1,0, 0,-1, 0,1])
+BISHOP_DIRS = array('b', [-1,-1, -1,1, 1,-1, 1,1])
+
+def rayAttacks(index, occupied, directions):
+    """
+    Slow reference for slider attacks: walks each of |directions| from |index|
+    until the edge or the first occupied square (which is still attacked).
+    Only used to build the magic tables.
+    """
+    attacks = 0
+    for k in range(0, len(directions), 2):
+        dr = directions[k]
+        dc = directions[k + 1]
+        row = (index >> 3) + dr
+        col = (index & 7) + dc
+        while 0 <= row < BOARD_SIZE and 0 <= col < BOARD_SIZE:
+            bit = 1 << ((row << 3) + col)
+            attacks |= bit
+            if occupied & bit:
+                break
+            row, col = row + dr, col + dc
+    return attacks
+
+def relevantOccupancy(index, directions):
+    """
+    The squares whose occupancy can change a slider's attacks from |index|:
+    every ray minus its last square, since a blocker on the edge blocks nothing.
+    """
+    mask = 0
+    for k in range(0, len(directions), 2):
+        dr = directions[k]
+        dc = directions[k + 1]
+        row = (index >> 3) + dr
+        col = (index & 7) + dc
+        while 0 <= row + dr < BOARD_SIZE and 0 <= col + dc < BOARD_SIZE:
+            mask |= 1 << ((row << 3) + col)
+            row, col = row + dr, col + dc
+    return mask
+
+def occupancySubsets(mask):
+    """ Every subset of |mask|, starting with 0 (Carry-Rippler trick). """
+    subsets = []
+    subset = 0
+    while True:
+        subsets.append(subset)
+        subset = (subset - mask) & mask
+        if subset == 0:
+            return subsets